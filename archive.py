@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+أرشفة الطلبات المكتملة حتى جداول orders و pricing تبقى صغيرة (طلبات اليوم تقريباً).
+
+قبل: الطريقة الوحيدة للتنظيف /api/reset (يحذف كل شي ويا التاريخ)، وبدونها الجداول تكبر للأبد.
+هسه:
+- archive_completed_orders(): الطلبات المكتملة (status = 'completed') اللي عمرها أكثر من ARCHIVE_AFTER_HOURS
+  تنتقل لـ orders_archive و pricing_archive (partition لكل شهر، القسم ينخلق وقت الحاجة)
+  بدفعات ARCHIVE_BATCH_SIZE، كل دفعة بمعاملة قصيرة: FOR UPDATE SKIP LOCKED (الطلب اللي ديتعدل هسه يتأجل
+  للمرة الجاية) و lock_timeout حتى ما نوكف اللوحة أو البوت.
+- الحذف من orders يسجل tombstone عادي: المخزن (repository.py) بكل عملية يشيل الطلب بالمزامنة الجاية.
+- tombstones أقدم من ARCHIVE_TOMBSTONE_RETENTION_DAYS تنشال، وأعلى version انشال ينحفظ بـ feed_horizon
+  (المخزن اللي مؤشره أقدم منه يسوي تحميل كامل بدل ما يفوته حذف).
+- get_archived_order(): قراءة طلب مؤرشف (للفاتورة)، find_archived_orders(): البحث برقم الفاتورة.
+عملية البوت تشغلها كل ARCHIVE_INTERVAL ثانية (job_queue)، أو يدوياً / بـ cron: python archive.py
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+from psycopg2.extras import RealDictCursor
+
+from db import DATABASE_URL, db_connection
+from events import publish_event
+
+logger = logging.getLogger(__name__)
+
+# الطلب المكتمل ينتقل للأرشيف بعد هالعمر (ساعات من إنشائه)
+ARCHIVE_AFTER_HOURS = float(os.environ.get("ARCHIVE_AFTER_HOURS", "24"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+# كل كم ثانية عملية البوت تأرشف (0 = لا)
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", "3600"))
+ARCHIVE_LOCK_TIMEOUT_MS = int(os.environ.get("ARCHIVE_LOCK_TIMEOUT_MS", "2000"))
+ARCHIVE_TOMBSTONE_RETENTION_DAYS = float(os.environ.get("ARCHIVE_TOMBSTONE_RETENTION_DAYS", "7"))
+
+_ORDER_COLUMNS = "id, user_id, title, phone_number, products, places_count, assigned_to, invoice_no, created_at"
+
+_stats_lock = threading.Lock()
+_stats = {"runs": 0, "errors": 0, "orders_archived": 0, "tombstones_pruned": 0, "last_run_ms": 0.0, "last_run_at": None}
+_partitions = set()
+
+
+def _month_start(when):
+    return datetime(when.year, when.month, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def _ensure_partitions(max_age_hours):
+    """
+    أقسام الأشهر اللي بيها طلبات راح تتأرشف (DDL بمعاملة لحالها، قبل الدفعات).
+    يرجع حد الأرشفة (created_at أقدم منه) بوقت قاعدة البيانات — نفس وقت DEFAULT CURRENT_TIMESTAMP للعمود.
+    """
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT LOCALTIMESTAMP - %s * interval '1 hour'", (max_age_hours,))
+            cutoff = cur.fetchone()[0]
+            cur.execute("""
+                SELECT DISTINCT date_trunc('month', created_at) FROM orders
+                WHERE status = 'completed' AND created_at < %s
+            """, (cutoff,))
+            months = [_month_start(r[0]) for r in cur.fetchall()]
+            months = [m for m in months if m not in _partitions]
+            if not months:
+                return cutoff
+            # عمليتين تأرشف سوه: وحدة بس تخلق الأقسام
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('talabat_archive_partitions'))")
+            cur.execute(f"SET LOCAL lock_timeout = '{ARCHIVE_LOCK_TIMEOUT_MS}ms'")
+            for month in months:
+                suffix = f"y{month.year}m{month.month:02d}"
+                bounds = (month, _next_month(month))
+                for table in ("orders_archive", "pricing_archive"):
+                    cur.execute("SELECT to_regclass(%s)", (f"{table}_{suffix}",))
+                    if cur.fetchone()[0] is None:
+                        cur.execute(f"CREATE TABLE {table}_{suffix} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", bounds)
+                        logger.info(f"Created archive partition {table}_{suffix}.")
+    _partitions.update(months)
+    return cutoff
+
+
+def _archive_batch(cutoff):
+    """دفعة وحدة بمعاملة وحدة. يرجع عدد الطلبات اللي انتقلت."""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SET LOCAL lock_timeout = '{ARCHIVE_LOCK_TIMEOUT_MS}ms'")
+            cur.execute("""
+                SELECT id FROM orders WHERE status = 'completed' AND created_at < %s
+                ORDER BY created_at LIMIT %s FOR UPDATE SKIP LOCKED
+            """, (cutoff, ARCHIVE_BATCH_SIZE))
+            ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                return 0
+            cur.execute(f"""
+                INSERT INTO orders_archive ({_ORDER_COLUMNS})
+                SELECT {_ORDER_COLUMNS} FROM orders WHERE id = ANY(%s)
+                ON CONFLICT (id, created_at) DO UPDATE SET
+                    title = EXCLUDED.title, phone_number = EXCLUDED.phone_number, products = EXCLUDED.products,
+                    places_count = EXCLUDED.places_count, assigned_to = EXCLUDED.assigned_to,
+                    invoice_no = EXCLUDED.invoice_no, archived_at = CURRENT_TIMESTAMP
+            """, (ids,))
+            cur.execute("""
+                INSERT INTO pricing_archive (order_id, product, buy, sell, prepared_by, order_created_at)
+                SELECT p.order_id, p.product, p.buy, p.sell, p.prepared_by, o.created_at
+                FROM pricing p JOIN orders o ON o.id = p.order_id
+                WHERE p.order_id = ANY(%s)
+                ON CONFLICT (order_id, product, order_created_at) DO UPDATE SET
+                    buy = EXCLUDED.buy, sell = EXCLUDED.sell, prepared_by = EXCLUDED.prepared_by
+            """, (ids,))
+            # التسعير ينحذف ويا الطلب (ON DELETE CASCADE)
+            cur.execute("DELETE FROM orders WHERE id = ANY(%s)", (ids,))
+            publish_event(cur, "orders_archived", count=len(ids))
+    return len(ids)
+
+
+def _prune_tombstones():
+    """tombstones القديمة: اللوحات والمخازن اللي مؤشرها أقدم من feed_horizon ياخذون تحميل كامل."""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SET LOCAL lock_timeout = '{ARCHIVE_LOCK_TIMEOUT_MS}ms'")
+            cur.execute("""
+                WITH cutoff AS (SELECT LOCALTIMESTAMP - %s * interval '1 day' AS at),
+                     o AS (DELETE FROM order_tombstones WHERE deleted_at < (SELECT at FROM cutoff) RETURNING version),
+                     p AS (DELETE FROM pricing_tombstones WHERE deleted_at < (SELECT at FROM cutoff) RETURNING version)
+                SELECT (SELECT count(*) FROM o) + (SELECT count(*) FROM p),
+                       GREATEST((SELECT max(version) FROM o), (SELECT max(version) FROM p))
+            """, (ARCHIVE_TOMBSTONE_RETENTION_DAYS,))
+            pruned, max_version = cur.fetchone()
+            if max_version is not None:
+                cur.execute("UPDATE feed_horizon SET version = GREATEST(version, %s)", (max_version + 1,))
+    return pruned
+
+
+def archive_completed_orders(max_age_hours=ARCHIVE_AFTER_HOURS):
+    """كل الطلبات المكتملة الأقدم من max_age_hours للأرشيف (دفعة ورا دفعة) + تنظيف tombstones. يرجع العدد."""
+    if not DATABASE_URL:
+        return 0
+    start = time.perf_counter()
+    archived = pruned = 0
+    try:
+        cutoff = _ensure_partitions(max_age_hours)
+        while True:
+            moved = _archive_batch(cutoff)
+            archived += moved
+            if moved < ARCHIVE_BATCH_SIZE:
+                break
+        pruned = _prune_tombstones()
+    except Exception as e:
+        with _stats_lock:
+            _stats["errors"] += 1
+        logger.error(f"Error archiving completed orders (archived {archived} before the error): {e}")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats["runs"] += 1
+        _stats["orders_archived"] += archived
+        _stats["tombstones_pruned"] += pruned
+        _stats["last_run_ms"] = elapsed_ms
+        _stats["last_run_at"] = datetime.now().isoformat()
+    if archived or pruned:
+        logger.info(f"Archived {archived} completed orders and pruned {pruned} tombstones in {elapsed_ms:.0f} ms.")
+    return archived
+
+
+async def run_archive_job(context=None):
+    """job بالـ job_queue مال البوت: الأرشفة بـ executor قاعدة البيانات حتى الـ loop ما يوكف."""
+    from async_db import run_db
+    await run_db(archive_completed_orders)
+
+
+def get_archived_order(order_id):
+    """(order, pricing, invoice_no) لطلب مؤرشف بنفس شكل order_repository.get_order، أو (None, {}, None)."""
+    if not DATABASE_URL:
+        return None, {}, None
+    with db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"SELECT {_ORDER_COLUMNS} FROM orders_archive WHERE id = %s", (order_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None, {}, None
+            cur.execute("""
+                SELECT product, buy, sell, prepared_by FROM pricing_archive
+                WHERE order_id = %s AND order_created_at = %s
+            """, (order_id, row['created_at']))
+            price_rows = cur.fetchall()
+    order = dict(row, created_at=row['created_at'].isoformat(), status="completed")
+    pricing = {rp['product']: {"buy": float(rp['buy']), "sell": float(rp['sell']), "prepared_by": rp['prepared_by']}
+               for rp in price_rows}
+    return order, pricing, row['invoice_no']
+
+
+def find_archived_orders(invoice_no, limit=20):
+    """الطلبات المؤرشفة برقم الفاتورة (بدون التسعير)."""
+    if not DATABASE_URL:
+        return []
+    with db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT {_ORDER_COLUMNS}, archived_at FROM orders_archive
+                WHERE invoice_no = %s ORDER BY created_at DESC LIMIT %s
+            """, (invoice_no, limit))
+            rows = cur.fetchall()
+    return [dict(r, created_at=r['created_at'].isoformat(), archived_at=r['archived_at'].isoformat()) for r in rows]
+
+
+def archived_order_ids(order_ids):
+    """اللي منها بالأرشيف (حتى طلب قديم محفوظ بـ bot_data ما يرجع ينضاف لـ orders)."""
+    if not DATABASE_URL or not order_ids:
+        return set()
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM orders_archive WHERE id = ANY(%s)", (list(order_ids),))
+            return {r[0] for r in cur.fetchall()}
+
+
+def get_archive_stats():
+    with _stats_lock:
+        return {
+            "enabled": bool(DATABASE_URL),
+            "after_hours": ARCHIVE_AFTER_HOURS,
+            "interval": ARCHIVE_INTERVAL,
+            "batch_size": ARCHIVE_BATCH_SIZE,
+            "runs": _stats["runs"],
+            "errors": _stats["errors"],
+            "orders_archived": _stats["orders_archived"],
+            "tombstones_pruned": _stats["tombstones_pruned"],
+            "last_run_ms": round(_stats["last_run_ms"], 3),
+            "last_run_at": _stats["last_run_at"],
+        }
+
+
+if __name__ == "__main__":
+    import main  # noqa: F401 — init_db (الجداول) يشتغل وقت استيراد main
+    archive_completed_orders()
+    print(get_archive_stats())
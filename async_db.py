@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+قاعدة البيانات من handlers البوت (async) بدون ما نوقف الـ event loop.
+
+psycopg2 يحجب: أي استعلام (أو اتصال TLS جديد بالـ pool) من handler يوقف كل الكروبات لحد ما يخلص.
+- run_db(fn, *args): ينفذ دالة تلمس قاعدة البيانات (مخزن الطلبات، الطلبات المعلّقة...) بـ thread من executor
+  محدود (BOT_DB_WORKERS، أقل من DB_POOL_MAX) والـ loop يكمل ويا باقي الرسائل.
+- instrument_handler: يقيس شكد كل handler يحجب الـ loop فعلاً (الوقت بين await والثاني، شامل الدوال
+  اللي يناديها)، ويسجل تحذير إذا خطوة وحدة طولت أكثر من LOOP_BLOCK_WARN_MS.
+- get_loop_stats(): لكل handler عدد المرات ومجموع الحجب وأطول خطوة؛ وللـ executor وقت الانتظار والتنفيذ.
+  عملية البوت المستقلة تطبعها بالسجل كل LOOP_STATS_LOG_INTERVAL ثانية (log_loop_stats بالـ job_queue).
+"""
+import os
+import time
+import asyncio
+import contextvars
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db import DB_POOL_MAX
+
+logger = logging.getLogger(__name__)
+
+BOT_DB_WORKERS = max(1, int(os.environ.get("BOT_DB_WORKERS", str(min(4, DB_POOL_MAX)))))
+# خطوة وحدة (بدون await) أطول من هيچ = الـ loop واكف على كل الكروبات
+LOOP_BLOCK_WARN_MS = float(os.environ.get("LOOP_BLOCK_WARN_MS", "100"))
+# كل كم ثانية عملية البوت تطبع ملخص الحجب بالسجل (0 = لا)
+LOOP_STATS_LOG_INTERVAL = float(os.environ.get("LOOP_STATS_LOG_INTERVAL", "600"))
+
+# الـ task اللي handler خارجي ديحسبها هسه (الداخلي بنفس الـ task ما يحسب)
+_timed_task = contextvars.ContextVar("timed_task", default=None)
+
+_executor = ThreadPoolExecutor(max_workers=BOT_DB_WORKERS, thread_name_prefix="bot-db")
+_stats_lock = threading.Lock()
+_handler_stats = {}
+_db_stats = {"calls": 0, "errors": 0, "wait_ms": 0.0, "max_wait_ms": 0.0, "run_ms": 0.0, "max_run_ms": 0.0}
+
+
+def _record_db(wait, run, failed):
+    with _stats_lock:
+        _db_stats["calls"] += 1
+        _db_stats["errors"] += failed
+        _db_stats["wait_ms"] += wait * 1000
+        _db_stats["max_wait_ms"] = max(_db_stats["max_wait_ms"], wait * 1000)
+        _db_stats["run_ms"] += run * 1000
+        _db_stats["max_run_ms"] = max(_db_stats["max_run_ms"], run * 1000)
+
+
+async def run_db(fn, *args, **kwargs):
+    """await run_db(order_repository.create_order, ...): الاستدعاء الحاجب بـ executor البوت."""
+    submitted = time.perf_counter()
+
+    def call():
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _record_db(started - submitted, time.perf_counter() - started, failed)
+
+    return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+
+class _TimedCoroutine:
+    """يشغّل coroutine الـ handler خطوة خطوة ويحسب وقت كل خطوة (كل خطوة = الـ loop محجوب بيها)."""
+
+    __slots__ = ("_coro", "_name", "_blocked", "_max_step", "_slow_steps")
+
+    def __init__(self, coro, name):
+        self._coro = coro
+        self._name = name
+        self._blocked = 0.0
+        self._max_step = 0.0
+        self._slow_steps = 0
+
+    def _step(self, start):
+        elapsed = time.perf_counter() - start
+        self._blocked += elapsed
+        if elapsed > self._max_step:
+            self._max_step = elapsed
+        if elapsed * 1000 > LOOP_BLOCK_WARN_MS:
+            self._slow_steps += 1
+            logger.warning(f"Handler {self._name} blocked the event loop for {elapsed * 1000:.0f} ms.")
+
+    def _finish(self):
+        with _stats_lock:
+            s = _handler_stats.setdefault(self._name, {"calls": 0, "blocked_ms": 0.0, "max_step_ms": 0.0, "slow_steps": 0})
+            s["calls"] += 1
+            s["blocked_ms"] += self._blocked * 1000
+            s["max_step_ms"] = max(s["max_step_ms"], self._max_step * 1000)
+            s["slow_steps"] += self._slow_steps
+
+    def __await__(self):
+        send, throw = self._coro.send, self._coro.throw
+        value, error = None, None
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    yielded = throw(error) if error is not None else send(value)
+                except StopIteration as e:
+                    self._step(start)
+                    return e.value
+                except BaseException:
+                    self._step(start)
+                    raise
+                self._step(start)
+                try:
+                    value, error = (yield yielded), None
+                except BaseException as e:
+                    value, error = None, e
+        finally:
+            self._finish()
+
+
+def instrument_handler(fn):
+    """
+    decorator لـ async handler: يسجل وقت حجب الـ loop باسمه بـ get_loop_stats.
+    handler ينادي handler ثاني (process_order → show_buttons): بس الخارجي يحسب، حتى نفس الخطوة ما تنحسب مرتين
+    ولا التحذير يطلع أكثر من مرة. task جديدة (create_task) تنحسب لحالها.
+    """
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        task = asyncio.current_task()
+        if task is not None and _timed_task.get() is task:
+            return await fn(*args, **kwargs)
+        token = _timed_task.set(task)
+        try:
+            return await _TimedCoroutine(fn(*args, **kwargs), name)
+        finally:
+            _timed_task.reset(token)
+
+    return wrapper
+
+
+def get_loop_stats():
+    with _stats_lock:
+        handlers = {}
+        for name, s in _handler_stats.items():
+            handlers[name] = {
+                "calls": s["calls"],
+                "blocked_ms": round(s["blocked_ms"], 3),
+                "avg_blocked_ms": round(s["blocked_ms"] / s["calls"], 3) if s["calls"] else 0.0,
+                "max_step_ms": round(s["max_step_ms"], 3),
+                "slow_steps": s["slow_steps"],
+            }
+        calls = _db_stats["calls"]
+        db = {
+            "workers": BOT_DB_WORKERS,
+            "calls": calls,
+            "errors": _db_stats["errors"],
+            "avg_wait_ms": round(_db_stats["wait_ms"] / calls, 3) if calls else 0.0,
+            "max_wait_ms": round(_db_stats["max_wait_ms"], 3),
+            "avg_run_ms": round(_db_stats["run_ms"] / calls, 3) if calls else 0.0,
+            "max_run_ms": round(_db_stats["max_run_ms"], 3),
+        }
+    return {"warn_ms": LOOP_BLOCK_WARN_MS, "handlers": handlers, "db_executor": db}
+
+
+async def log_loop_stats(context=None):
+    """ملخص الحجب بالسجل (job بالـ job_queue مال البوت)."""
+    stats = get_loop_stats()
+    for name, s in sorted(stats["handlers"].items(), key=lambda kv: -kv[1]["blocked_ms"]):
+        logger.info(f"Loop blocking {name}: calls={s['calls']} avg={s['avg_blocked_ms']}ms "
+                    f"max_step={s['max_step_ms']}ms slow_steps={s['slow_steps']}")
+    db = stats["db_executor"]
+    logger.info(f"Bot DB executor: calls={db['calls']} errors={db['errors']} avg_wait={db['avg_wait_ms']}ms "
+                f"avg_run={db['avg_run_ms']}ms max_run={db['max_run_ms']}ms")
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+مقارنة تصنيف المنتجات: الدوال الثلاث بالترتيب (is_meat ثم is_fish ثم is_vegetable_fruit)
+ضد المصنّف الواحد (CategoryClassifier). يتأكد إن النتائج نفسها ويطبع الوقت لكل منتج.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_classifier.py [عدد المنتجات]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features.product_categories import (  # noqa: E402
+    CategoryClassifier,
+    _get_fish_words,
+    _get_meat_words,
+    _get_veg_words,
+    is_fish,
+    is_meat,
+    is_vegetable_fruit,
+)
+
+_FILLER = ["كيلو", "2", "نص", "ربع", "حبة", "علبة", "خبز", "صمون", "بيض", "جبن", "رز", "شاي", "سكر", "زيت", "كارتون"]
+
+
+def _legacy(product):
+    if is_meat(product):
+        return "meat"
+    if is_fish(product):
+        return "fish"
+    if is_vegetable_fruit(product):
+        return "veg"
+    return "unknown"
+
+
+def _products(count, rng):
+    words = _get_meat_words() + _get_fish_words() + _get_veg_words()
+    products = ["", "   ", "سمكة", "سمك", "لحم سمك"]
+    while len(products) < count:
+        parts = rng.sample(_FILLER, rng.randint(1, 3))
+        if rng.random() < 0.6:
+            parts.insert(rng.randint(0, len(parts)), rng.choice(words))
+        products.append(" ".join(parts))
+    return products
+
+
+def run(count=20_000, seed=11):
+    rng = random.Random(seed)
+    products = _products(count, rng)
+
+    start = time.perf_counter()
+    classifier = CategoryClassifier(_get_meat_words(), _get_fish_words(), _get_veg_words())
+    build = time.perf_counter() - start
+
+    t0 = time.perf_counter()
+    expected = [_legacy(p) for p in products]
+    t1 = time.perf_counter()
+    got = [classifier.classify(p) for p in products]
+    t2 = time.perf_counter()
+    assert got == expected, "classifier differs from is_meat/is_fish/is_vegetable_fruit"
+    print(
+        f"products={len(products)}  build={build * 1000:.2f} ms  "
+        f"legacy={(t1 - t0) / len(products) * 1e6:.2f} us  "
+        f"classifier={(t2 - t1) / len(products) * 1e6:.2f} us  x{(t1 - t0) / (t2 - t1):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+فحص features.phone_numbers على phone_corpus.jsonl (الشكل الموحّد 07XXXXXXXXX أو None) + قياس السرعة:
+البحث بمرور واحد على الرسالة (find_phone_line) ضد استخراج الرقم سطر سطر مثل logic_old القديم.
+كل سطر بالملف: {"text", "phone"} لنص واحد، أو {"lines", "phone", "line"} لرسالة كاملة.
+أي اختلاف يطبع الحالة ويطلع بكود 1.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_phone_numbers.py [عدد الرسائل]
+"""
+import json
+import os
+import random
+import re
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_HERE))
+
+from features.phone_numbers import extract_phone, find_phone_line, normalize_phone  # noqa: E402
+
+CORPUS_FILE = os.path.join(_HERE, "phone_corpus.jsonl")
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check(cases):
+    ok = True
+    for case in cases:
+        if "lines" in case:
+            got = find_phone_line(case["lines"])
+            expected = (case["phone"], case["line"])
+        else:
+            got = (extract_phone(case["text"]), normalize_phone(case["text"]))
+            expected = (case["phone"], case["phone"])
+        if got != expected:
+            ok = False
+            print(f"MISMATCH {case!r}: expected {expected!r}, got {got!r}")
+    return ok
+
+
+def _legacy_line_extractor(text):
+    """الاستخراج القديم بـ logic_old (سطر سطر) — للمقارنة بالسرعة بس، نتيجته مو موحّدة."""
+    if not text:
+        return None
+    digits = re.sub(r"[^0-9]", "", text)
+    if not digits:
+        return None
+    if digits.startswith("964") and len(digits) >= 12:
+        return "0" + digits[3:]
+    if digits.startswith("07") and len(digits) >= 10:
+        return digits[:11] if len(digits) >= 11 else digits
+    if len(digits) == 9 and digits.startswith("7"):
+        return "0" + digits
+    return None
+
+
+def _legacy_find(lines):
+    for i, line in enumerate(lines):
+        candidate = _legacy_line_extractor(line)
+        if candidate:
+            return candidate, i
+    return None, None
+
+
+def _fake_messages(count, rng):
+    products = ["لحم عظم كيلو", "طماطة 2 كيلو", "خبز 10", "بيض طبقة", "رز 5 كيلو", "خيار", "بصل 3", "دجاج 2"]
+    messages = []
+    for _ in range(count):
+        lines = ["البصرة الجزائر قرب الجامع"] + rng.sample(products, rng.randint(3, 8))
+        lines.insert(rng.randint(1, len(lines)), rng.choice(["07712345678", "+964 780 111 2233", "0771 234 5678"]))
+        messages.append(lines)
+    return messages
+
+
+def throughput(count):
+    messages = _fake_messages(count, random.Random(16))
+    for label, fn in (("per-line (old)", _legacy_find), ("single pass", find_phone_line)):
+        start = time.perf_counter()
+        for lines in messages:
+            fn(lines)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: messages={count}  {elapsed / count * 1e6:.2f} us/message")
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    ok = check(corpus)
+    print(f"phone corpus: {len(corpus)} cases, {'OK' if ok else 'FAILED'}")
+    throughput(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    sys.exit(0 if ok else 1)
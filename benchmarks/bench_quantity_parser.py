@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+فحص parse_quantity_kg على مجموعة النصوص الذهبية (quantity_corpus.tsv) + قياس السرعة.
+أي اختلاف عن القيم المتوقعة يطبع النص ويطلع بكود 1.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_quantity_parser.py [عدد التكرارات]
+"""
+import os
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_HERE))
+
+from features.fixed_prices import parse_quantity_kg, suggest_fixed_prices  # noqa: E402
+
+CORPUS_FILE = os.path.join(_HERE, "quantity_corpus.tsv")
+
+
+def load_corpus(path=CORPUS_FILE):
+    cases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            text, expected = line.rstrip("\n").rsplit("\t", 1)
+            cases.append((text, None if expected == "None" else float(expected)))
+    return cases
+
+
+def check(cases):
+    failures = [(t, e, parse_quantity_kg(t)) for t, e in cases if parse_quantity_kg(t) != e]
+    for text, expected, got in failures:
+        print(f"MISMATCH {text!r}: expected {expected!r}, got {got!r}")
+    return not failures
+
+
+def throughput(cases, repeat):
+    texts = [t for t, _ in cases] * repeat
+    start = time.perf_counter()
+    for t in texts:
+        parse_quantity_kg(t)
+    parse_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for t in texts:
+        suggest_fixed_prices(t)
+    suggest_time = time.perf_counter() - start
+    print(
+        f"texts={len(texts)}  parse_quantity_kg={len(texts) / parse_time:,.0f}/s "
+        f"({parse_time / len(texts) * 1e6:.2f} us)  "
+        f"suggest_fixed_prices={len(texts) / suggest_time:,.0f}/s ({suggest_time / len(texts) * 1e6:.2f} us)"
+    )
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    ok = check(corpus)
+    print(f"golden corpus: {len(corpus)} cases, {'OK' if ok else 'FAILED'}")
+    throughput(corpus, int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+    sys.exit(0 if ok else 1)
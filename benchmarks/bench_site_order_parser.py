@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+فحص parse_site_order_message على رسائل المتجر (site_order_corpus.jsonl) + مقارنة السرعة مع المحلل القديم
+(سلسلة re.match/re.search لكل سطر — نسخته هنا للمقارنة بس). أي اختلاف يطبع النص ويطلع بكود 1.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_site_order_parser.py [عدد التكرارات]
+"""
+import json
+import os
+import re
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_HERE))
+
+from features.site_order_parser import parse_site_order_message  # noqa: E402
+
+CORPUS_FILE = os.path.join(_HERE, "site_order_corpus.jsonl")
+# الطلبات اللي بيها هذا العدد من المنتجات أو أكثر تنحسب «كبيرة»
+LARGE_ORDER_ITEMS = 20
+
+_RE_product_line = re.compile(r"^الاسم\s*[:\：]\s*(.+)$", re.IGNORECASE)
+_RE_quantity_line = re.compile(r"^الكمية\s*[:\：]\s*(\d+)", re.IGNORECASE)
+_RE_price_line = re.compile(r"^السعر\s*[:\：]\s*(\d+)", re.IGNORECASE)
+
+
+def legacy_parse_site_order_message(text: str):
+    """تحليل نص طلب الموقع: اسم الزبون، العنوان، النقطة الدالة، المنتجات (الاسم + الكمية + السعر فقط)."""
+    if not text:
+        return None
+    lines = [l.strip() for l in text.splitlines()]
+    customer_name = ""
+    address = ""
+    landmark = ""
+    items = []
+    total_price = None
+    i = 0
+    n = len(lines)
+    while i < n:
+        line = lines[i]
+        if re.match(r"^اسم\s*الزبون\s*[:\：]", line):
+            m = re.search(r"[:\：]\s*(.+)$", line)
+            if m:
+                customer_name = m.group(1).strip()
+            i += 1
+            continue
+        if re.match(r"^العنوان\s*[:\：]", line):
+            m = re.search(r"[:\：]\s*(.+)$", line)
+            if m:
+                address = m.group(1).strip()
+            i += 1
+            continue
+        if re.match(r"^اقرب\s*نقطة\s*دالة\s*[:\：]", line):
+            m = re.search(r"[:\：]\s*(.+)$", line)
+            if m:
+                landmark = m.group(1).strip()
+            i += 1
+            continue
+        if re.match(r"^ملاحظات\s*[:\：]?", line) or line in ("**", "***", "******", "معلومات الطلب", "") or re.match(r"^-+$", line):
+            i += 1
+            continue
+        if "السعر الكلي" in line:
+            try:
+                rest = line.replace("السعر الكلي", "").replace("*", "").strip()
+                if rest.isdigit():
+                    total_price = int(rest)
+                elif i + 1 < n and lines[i + 1].replace("*", "").strip().isdigit():
+                    total_price = int(lines[i + 1].replace("*", "").strip())
+                elif i + 2 < n and lines[i + 2].replace("*", "").strip().isdigit():
+                    total_price = int(lines[i + 2].replace("*", "").strip())
+            except ValueError:
+                pass
+            i += 1
+            continue
+        m_name = _RE_product_line.match(line)
+        if m_name:
+            raw = m_name.group(1).strip()
+            if re.match(r"^اسم\s*المحل\s*[:\：]\s*", raw):
+                raw = re.sub(r"^اسم\s*المحل\s*[:\：]\s*", "", raw).strip()
+            elif re.match(r"^اسم\s*المحل\s+", raw):
+                raw = re.sub(r"^اسم\s*المحل\s+", "", raw).strip()
+            name = raw
+            qty = 1
+            price = 0
+            if i + 1 < n:
+                m_q = _RE_quantity_line.match(lines[i + 1])
+                if m_q:
+                    try:
+                        qty = int(m_q.group(1))
+                    except ValueError:
+                        pass
+            if i + 2 < n:
+                m_p = _RE_price_line.match(lines[i + 2])
+                if m_p:
+                    try:
+                        price = int(m_p.group(1))
+                    except ValueError:
+                        pass
+            if name and name != "اسم المحل":
+                items.append({"name": name, "qty": qty, "price": price})
+            i += 1
+            if i < n and _RE_quantity_line.match(lines[i]):
+                i += 1
+            if i < n and _RE_price_line.match(lines[i]):
+                i += 1
+            continue
+        if _RE_quantity_line.match(line) or _RE_price_line.match(line):
+            i += 1
+            continue
+        i += 1
+    return {
+        "customer_name": customer_name,
+        "address": address,
+        "landmark": landmark,
+        "items": items,
+        "total_price": total_price,
+    }
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check(cases):
+    ok = True
+    for case in cases:
+        got = parse_site_order_message(case["text"])
+        if got != case["expected"]:
+            ok = False
+            print(f"MISMATCH {case['text'][:80]!r}...: expected {case['expected']!r}, got {got!r}")
+    return ok
+
+
+def _time(fn, texts):
+    start = time.perf_counter()
+    for t in texts:
+        fn(t)
+    return time.perf_counter() - start
+
+
+def compare(label, texts, repeat):
+    texts = texts * repeat
+    old = _time(legacy_parse_site_order_message, texts)
+    new = _time(parse_site_order_message, texts)
+    print(
+        f"{label}: messages={len(texts)}  old={old / len(texts) * 1e6:.1f} us  "
+        f"new={new / len(texts) * 1e6:.1f} us  speedup={old / new:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    ok = check(corpus)
+    print(f"corpus: {len(corpus)} messages, {'OK' if ok else 'FAILED'}")
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    texts = [c["text"] for c in corpus]
+    large = [c["text"] for c in corpus if len(c["expected"]["items"]) >= LARGE_ORDER_ITEMS]
+    compare("all", texts, repeat)
+    compare(f"large (>= {LARGE_ORDER_ITEMS} items)", large, repeat)
+    sys.exit(0 if ok else 1)
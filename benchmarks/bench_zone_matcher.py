@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+مقارنة سرعة إيجاد أطول منطقة بالنص: اللوب القديم (`zone in text` لكل منطقة) ضد آلة Aho-Corasick.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_zone_matcher.py [عدد المناطق ...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features.aho_corasick import AhoCorasick  # noqa: E402
+from features.delivery_zones import _longest_zone_in_text_scan, load_delivery_zones  # noqa: E402
+
+_LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+
+
+def _fake_zones(count, rng):
+    """مناطق حقيقية من الملف + أسماء عشوائية (كلمة أو كلمتين) لحد ما نوصل العدد المطلوب."""
+    zones = dict(load_delivery_zones())
+    while len(zones) < count:
+        words = ["".join(rng.choice(_LETTERS) for _ in range(rng.randint(3, 7))) for _ in range(rng.randint(1, 2))]
+        zones[" ".join(words)] = rng.choice((3, 4, 5))
+    return zones
+
+
+def _fake_messages(zones, count, rng):
+    keys = list(zones)
+    messages = []
+    for _ in range(count):
+        zone = rng.choice(keys)
+        messages.append(f"{zone} قرب الجامع\n07712345678\nلحم عظم كيلو\nطماطة 2 كيلو\nخبز 10")
+    return messages
+
+
+def _time(fn, messages):
+    start = time.perf_counter()
+    results = [fn(m) for m in messages]
+    return time.perf_counter() - start, results
+
+
+def run(zone_count, message_count=200, seed=7):
+    rng = random.Random(seed)
+    zones = _fake_zones(zone_count, rng)
+    messages = _fake_messages(zones, message_count, rng)
+    keys = list(zones)
+
+    start = time.perf_counter()
+    matcher = AhoCorasick(keys)
+    build = time.perf_counter() - start
+
+    loop_time, loop_results = _time(lambda m: _longest_zone_in_text_scan(m, zones), messages)
+
+    def _ac(m):
+        idx = matcher.longest(m)
+        return keys[idx] if idx != -1 else None
+
+    ac_time, ac_results = _time(_ac, messages)
+    assert ac_results == loop_results, "Aho-Corasick result differs from the scan loop"
+
+    print(
+        f"zones={len(zones):>7}  build={build * 1000:8.1f} ms  "
+        f"loop={loop_time / message_count * 1e6:9.1f} us/msg  "
+        f"aho-corasick={ac_time / message_count * 1e6:7.1f} us/msg  "
+        f"speedup x{loop_time / ac_time:.0f}"
+    )
+
+
+if __name__ == "__main__":
+    counts = [int(a) for a in sys.argv[1:]] or [10_000, 100_000]
+    for c in counts:
+        run(c)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+مقارنة اقتراح أقرب المناطق: difflib.get_close_matches على كل الأسماء ضد فهرس الحروف (NgramIndex).
+يتأكد إن النتائج نفسها لقيم cutoff/n المستعملة بالكود، ويطبع الوقت لكل عبارة.
+
+التشغيل من جذر المشروع:
+    python benchmarks/bench_zone_suggestions.py [عدد المناطق ...]
+"""
+import difflib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features.delivery_zones import zone_registry  # noqa: E402
+from features.ngram_index import NgramIndex  # noqa: E402
+
+_LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوية"
+
+# (n, cutoff) المستعملة حالياً بالكود (delivery_zones + /api/add_order)
+_USED_SETTINGS = ((6, 0.4), (1, 0.45), (2, 0.5), (2, 0.35), (4, 0.4), (6, 0.2))
+
+
+def _typo(word, rng):
+    chars = list(word)
+    for _ in range(rng.randint(0, 2)):
+        op, i = rng.randint(0, 2), rng.randrange(len(chars))
+        if op == 0:
+            chars[i] = rng.choice(_LETTERS)
+        elif op == 1:
+            chars.insert(i, rng.choice(_LETTERS))
+        elif len(chars) > 2:
+            del chars[i]
+    return "".join(chars)
+
+
+def _names(count, rng):
+    names = list(zone_registry.zone_names())
+    seen = set(names)
+    while len(names) < count:
+        base = rng.choice(names[:150])
+        name = _typo(base, rng) if rng.random() < 0.5 else "".join(rng.choice(_LETTERS) for _ in range(rng.randint(3, 9)))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def run(count, queries=300, seed=3):
+    rng = random.Random(seed)
+    names = _names(count, rng)
+    phrases = [_typo(rng.choice(names), rng) for _ in range(queries // 2)]
+    phrases += ["".join(rng.choice(_LETTERS) for _ in range(rng.randint(2, 8))) for _ in range(queries - len(phrases))]
+
+    start = time.perf_counter()
+    index = NgramIndex(names)
+    build = time.perf_counter() - start
+
+    for n, cutoff in _USED_SETTINGS:
+        t0 = time.perf_counter()
+        expected = [difflib.get_close_matches(p, names, n=n, cutoff=cutoff) for p in phrases]
+        t1 = time.perf_counter()
+        got = [index.get_close_matches(p, n=n, cutoff=cutoff) for p in phrases]
+        t2 = time.perf_counter()
+        assert got == expected, f"index differs from difflib (n={n}, cutoff={cutoff})"
+        print(
+            f"names={len(names):>6}  n={n} cutoff={cutoff:<4}  build={build * 1000:7.1f} ms  "
+            f"difflib={(t1 - t0) / len(phrases) * 1e6:9.1f} us  "
+            f"index={(t2 - t1) / len(phrases) * 1e6:8.1f} us  x{(t1 - t0) / max(t2 - t1, 1e-9):.1f}"
+        )
+
+
+if __name__ == "__main__":
+    counts = [int(a) for a in sys.argv[1:]] or [len(zone_registry.zone_names()), 2_000, 20_000]
+    for c in counts:
+        run(c)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+تشغيل بوت التليكرام بعملية مستقلة عن اللوحة (وضع الإنتاج):
+    python bot.py
+نفس main (الإعدادات، db.py، مخزن الطلبات)؛ الطلبات توصل للوحة عبر قاعدة البيانات وأحداث LISTEN/NOTIFY.
+بعد SIGTERM/SIGINT الـ polling يوقف وننتظر كتابة الطلبات المتغيّرة قبل ما نطلع.
+"""
+import logging
+import sys
+
+from main import run_bot
+from persistence import order_persistence
+
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    if not run_bot():
+        logger.error("TELEGRAM_BOT_TOKEN is not set.")
+        sys.exit(1)
+    order_persistence.close()
+    logger.info("Bot stopped.")
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+طبقة الاتصال بقاعدة البيانات (PostgreSQL).
+
+بدل ما كل طلب يفتح اتصال جديد (TCP + TLS) نستعمل pool مشترك:
+- حجم أدنى/أعلى قابل للتعديل (DB_POOL_MIN / DB_POOL_MAX).
+- إذا كل الاتصالات مشغولة الطلب ينتظر لحد DB_POOL_TIMEOUT ثانية.
+- فحص صحة الاتصال قبل إعطائه (إذا مسكّر أو قاعد فترة طويلة بدون استعمال) وإعادة الاتصال تلقائياً.
+- إحصائيات (المستعمل، المنتظرين، زمن الحصول على اتصال) حتى نعرف شكد نكبّر الـ pool.
+
+الاستعمال:
+    with db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                cur.execute(...)
+    # commit تلقائي عند النجاح و rollback عند الخطأ
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# الاتصال اللي قاعد أكثر من هذي المدة (ثواني) نفحصه بـ SELECT 1 قبل ما نعطيه
+DB_HEALTHCHECK_IDLE = float(os.environ.get("DB_HEALTHCHECK_IDLE", "30"))
+
+
+class PoolTimeout(Exception):
+    """ما توفر اتصال خلال DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """Pool اتصالات آمن مع الـ threads (فوق ThreadedConnectionPool) مع انتظار وفحص صحة وإحصائيات."""
+
+    def __init__(self, dsn, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_idle=DB_HEALTHCHECK_IDLE, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self.connect_kwargs = connect_kwargs
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._stats_lock = threading.Lock()
+        self._last_used = {}
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self._checkout_total = 0.0
+        self._checkout_max = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pg_pool.ThreadedConnectionPool(
+                        self.minconn, self.maxconn, self.dsn, **self.connect_kwargs
+                    )
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last = self._last_used.get(id(conn))
+        if last is not None and time.monotonic() - last < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        with self._stats_lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.timeout)
+        with self._stats_lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timeouts += 1
+        if not acquired:
+            raise PoolTimeout(f"no database connection available after {self.timeout}s")
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            if not self._is_healthy(conn):
+                logger.warning("Discarding broken database connection and reconnecting.")
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+                with self._stats_lock:
+                    self.reconnects += 1
+        except Exception:
+            self._slots.release()
+            raise
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self._checkout_total += elapsed
+            self._checkout_max = max(self._checkout_max, elapsed)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        try:
+            pool = self._get_pool()
+            if discard or conn.closed:
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+            else:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn)
+        finally:
+            with self._stats_lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """اتصال من الـ pool: commit عند النجاح، rollback عند الخطأ، والاتصال المكسور ينرمي."""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+                "avg_checkout_ms": round(self._checkout_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_checkout_ms": round(self._checkout_max * 1000, 3),
+            }
+
+    def closeall(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._last_used.clear()
+
+
+db_pool = ConnectionPool(DATABASE_URL, sslmode='require') if DATABASE_URL else None
+
+
+@contextmanager
+def db_connection():
+    """اتصال مشترك من الـ pool، أو None إذا ماكو DATABASE_URL."""
+    if db_pool is None:
+        yield None
+        return
+    with db_pool.connection() as conn:
+        yield conn
+
+
+def get_db_stats():
+    if db_pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **db_pool.stats()}
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+أحداث الطلبات للوحة التحكم (Server-Sent Events).
+
+الكتابة (إضافة طلب، تسعير، إنهاء) تنشر حدث بنفس معاملة قاعدة البيانات عبر pg_notify،
+فالحدث يطلع بس بعد الـ commit ويوصل لكل العمليات اللي تسوي LISTEN (مو بس العملية اللي كتبت).
+بكل عملية thread واحد يسمع القناة ويوزع الحدث على المشتركين (كل متصفح مفتوح على /api/stream).
+بدون DATABASE_URL الحدث يتوزع محلياً مباشرة.
+"""
+import os
+import json
+import queue
+import select
+import logging
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from db import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = "order_events"
+# كل كم ثانية نرسل سطر فارغ حتى البروكسي ما يسد الاتصال
+SSE_KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", "15"))
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "100"))
+# كل بث مفتوح ياخذ thread من threads العملية (gthread) طول ما هو مفتوح. فوق هذا الحد بالعملية نرفض البث
+# واللوحة ترجع للاستعلام، حتى يبقى نص الـ threads على الأقل لباقي الطلبات
+SSE_MAX_CONNECTIONS = int(os.environ.get("SSE_MAX_CONNECTIONS", str(max(1, int(os.environ.get("WEB_THREADS", "8")) // 2))))
+# بعد الرفض المتصفح يرجع يحاول البث بعد هذا الوقت (ms)
+SSE_BUSY_RETRY_MS = int(os.environ.get("SSE_BUSY_RETRY_MS", "60000"))
+
+
+class EventBroadcaster:
+    """يوزع الأحداث على كل المشتركين بنفس العملية. كل مشترك له طابور محدود."""
+
+    def __init__(self, max_queue=SSE_QUEUE_SIZE, max_subscribers=SSE_MAX_CONNECTIONS):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        # مشتركين لازم يسوون تحديث كامل بس ما لحقنا نحط resync بطابورهم (ينقرأ بـ take_resync)
+        self._resync = set()
+        self._hooks = []
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def subscribe(self):
+        """طابور جديد للمشترك، أو None إذا وصلنا حد SSE_MAX_CONNECTIONS."""
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+            self._resync.discard(q)
+
+    def take_resync(self, q):
+        """True مرة وحدة إذا هذا المشترك تعلّم يحتاج تحديث كامل."""
+        with self._lock:
+            if q in self._resync:
+                self._resync.discard(q)
+                return True
+        return False
+
+    def add_hook(self, fn):
+        """fn(event) ينادى لكل حدث قبل المشتركين (مثلاً مخزن الطلبات يعلّم نسخته قديمة). لازم يكون سريع."""
+        with self._lock:
+            self._hooks.append(fn)
+
+    def publish_local(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            hooks = list(self._hooks)
+        for fn in hooks:
+            try:
+                fn(event)
+            except Exception as e:
+                logger.error(f"Error in order event hook: {e}")
+        self.published += 1
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # المتصفح بطيء: نفرغ طابوره ونطلب منه تحديث كامل بدل ما نضيع أحداث بصمت
+                self.dropped += 1
+                try:
+                    while True:
+                        q.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait({"type": "resync"})
+                except queue.Full:
+                    # نشر ثاني رجع ملاه بنفس اللحظة: نعلّمه وهو ياخذ resync بقراءته الجاية (ما نرمي للي كتب)
+                    with self._lock:
+                        if q in self._subscribers:
+                            self._resync.add(q)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {"subscribers": subscribers, "max_subscribers": self.max_subscribers,
+                "published": self.published, "dropped": self.dropped, "rejected": self.rejected}
+
+
+broadcaster = EventBroadcaster()
+
+_listener_thread = None
+_listener_lock = threading.Lock()
+
+
+def publish_event(cur, event_type, order_id=None, **extra):
+    """
+    نشر حدث. cur: مؤشر المعاملة اللي سوت الكتابة (الحدث يطلع بعد commit)،
+    أو None إذا ماكو قاعدة بيانات (ينوزع محلياً فوراً).
+    """
+    event = {"type": event_type, "order_id": order_id, **extra}
+    if cur is None:
+        broadcaster.publish_local(event)
+        return
+    cur.execute("SELECT pg_notify(%s, %s)", (EVENTS_CHANNEL, json.dumps(event, ensure_ascii=False)))
+
+
+def _listen_forever():
+    backoff = 1.0
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {EVENTS_CHANNEL}")
+            logger.info("Listening for order events on channel %s.", EVENTS_CHANNEL)
+            backoff = 1.0
+            # بعد (إعادة) الاتصال ممكن فاتتنا أحداث — نخلي اللوحات تسوي تحديث
+            broadcaster.publish_local({"type": "resync"})
+            while True:
+                if select.select([conn], [], [], SSE_KEEPALIVE) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    try:
+                        event = json.loads(note.payload)
+                    except ValueError:
+                        event = {"type": "resync"}
+                    broadcaster.publish_local(event)
+        except Exception as e:
+            logger.warning(f"Order events listener lost its connection: {e}. Retrying in {backoff:.0f}s.")
+        finally:
+            if conn is not None and not conn.closed:
+                conn.close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 30.0)
+
+
+def ensure_listener():
+    """تشغيل thread الاستماع (مرة وحدة بالعملية) إذا أكو قاعدة بيانات."""
+    global _listener_thread
+    if not DATABASE_URL:
+        return
+    with _listener_lock:
+        if _listener_thread is None or not _listener_thread.is_alive():
+            _listener_thread = threading.Thread(target=_listen_forever, name="order-events-listener", daemon=True)
+            _listener_thread.start()
+
+
+def sse_stream():
+    """
+    مولّد نص text/event-stream لمشترك واحد (ينفك الاشتراك لما المتصفح يسكر الاتصال).
+    إذا العملية وصلت حد البث: حدث busy ونسكر فوراً (الـ thread يتحرر)، واللوحة تستعلم لحد ما المتصفح
+    يرجع يتصل بعد SSE_BUSY_RETRY_MS.
+    """
+    ensure_listener()
+    q = broadcaster.subscribe()
+    if q is None:
+        yield f"retry: {SSE_BUSY_RETRY_MS}\n\nevent: busy\ndata: {{}}\n\n"
+        return
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            if broadcaster.take_resync(q):
+                yield "event: resync\ndata: {\"type\": \"resync\"}\n\n"
+            try:
+                event = q.get(timeout=SSE_KEEPALIVE)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"event: {event.get('type', 'message')}\ndata: {data}\n\n"
+    finally:
+        broadcaster.unsubscribe(q)
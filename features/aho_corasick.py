@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""مطابقة عدة كلمات بنفس الوقت (Aho-Corasick): مرور واحد على النص بدل `كلمة in نص` لكل كلمة."""
+
+
+class AhoCorasick:
+    """
+    آلة مبنية مرة وحدة من قائمة كلمات. ترتيب الكلمات بالقائمة مهم:
+    رقم الكلمة (index) يستعمل لكسر التعادل — الأسبق بالقائمة يفوز.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        goto = [{}]
+        term = [-1]
+        for idx, pat in enumerate(self.patterns):
+            if not pat:
+                continue
+            node = 0
+            for ch in pat:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    term.append(-1)
+                node = nxt
+            if term[node] == -1:
+                term[node] = idx
+
+        n = len(goto)
+        fail = [0] * n
+        # out[node]: أطول كلمة تنتهي عند هذي العقدة (نفسها أو عبر روابط الفشل)
+        out = list(term)
+        # dict_link[node]: أقرب عقدة نهائية على سلسلة الفشل (لاستخراج كل التطابقات)
+        dict_link = [0] * n
+        order = []
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            order.append(node)
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[child] = f
+                if out[child] == -1:
+                    out[child] = out[f]
+                dict_link[child] = f if term[f] != -1 else dict_link[f]
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._term = term
+        self._out = out
+        self._dict_link = dict_link
+        self._lengths = [len(p) for p in self.patterns]
+        self.order = order
+        # first[node]: أصغر رقم كلمة تنتهي عند هذي العقدة (نفسها أو عبر روابط الفشل)
+        first = [-1] * n
+        for node in order:
+            own, inherited = term[node], first[fail[node]]
+            first[node] = own if inherited == -1 or (own != -1 and own < inherited) else inherited
+        self._first = first
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def iter_matches(self, text):
+        """يرجع (بداية، رقم الكلمة) لكل ظهور لأي كلمة بالنص، بمرور واحد."""
+        goto, fail, term, dict_link, lengths = self._goto, self._fail, self._term, self._dict_link, self._lengths
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if term[node] != -1 else dict_link[node]
+            while hit:
+                idx = term[hit]
+                yield pos - lengths[idx] + 1, idx
+                hit = dict_link[hit]
+
+    def find_all(self, text):
+        return list(self.iter_matches(text))
+
+    def longest(self, text):
+        """
+        رقم أطول كلمة تظهر بالنص، أو -1.
+        عند التساوي بالطول يفوز الأسبق بالقائمة (نفس سلوك اللوب القديم على مفاتيح القاموس).
+        """
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        best = -1
+        best_len = 0
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            idx = out[node]
+            if idx != -1:
+                ln = lengths[idx]
+                if ln > best_len or (ln == best_len and idx < best):
+                    best = idx
+                    best_len = ln
+        return best
+
+    def first(self, text):
+        """رقم الكلمة الأسبق بالقائمة (مو بالنص) من بين الكلمات الظاهرة بالنص، أو -1. يوقف بدري عند الكلمة 0."""
+        goto, fail, first = self._goto, self._fail, self._first
+        best = -1
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            idx = first[node]
+            if idx != -1 and (best == -1 or idx < best):
+                best = idx
+                if best == 0:
+                    break
+        return best
+
+    def node_masks(self, pattern_masks):
+        """
+        لكل عقدة: OR لأقنعة (bitmask) كل الكلمات اللي تنتهي عندها (نفسها أو عبر روابط الفشل).
+        pattern_masks: قناع لكل كلمة بنفس ترتيب القائمة. تنحسب مرة وحدة وتنمرر لـ scan_mask.
+        """
+        term, fail = self._term, self._fail
+        masks = [0] * len(self._goto)
+        for node in self.order:
+            own = pattern_masks[term[node]] if term[node] != -1 else 0
+            masks[node] = own | masks[fail[node]]
+        return masks
+
+    def scan_mask(self, text, node_masks, stop_mask=0):
+        """OR لأقنعة كل الكلمات الظاهرة بالنص؛ يوقف بدري أول ما يظهر أي بت من stop_mask."""
+        goto, fail = self._goto, self._fail
+        acc = 0
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            m = node_masks[node]
+            if m:
+                acc |= m
+                if acc & stop_mask:
+                    break
+        return acc
+
@@ -4,41 +4,217 @@ import os
 import re
 import json
 import difflib
+import hashlib
+import threading
+import time
+
+from features.aho_corasick import AhoCorasick
+from features.ngram_index import NgramIndex
 
 ZONES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "delivery_zones.json")
 
+# أقل مدة (بالثواني) بين فحصين لتاريخ تعديل الملف — حتى ما نسوي stat بكل استدعاء
+ZONES_CHECK_INTERVAL = float(os.environ.get("ZONES_CHECK_INTERVAL", "2"))
+
+
+class ZoneRegistry:
+    """
+    سجل المناطق بالذاكرة (واحد للعملية كلها):
+    - يقرأ الملف ويحلله مرة وحدة، ويحتفظ بالقاموس + الفهارس المشتقة منه.
+    - يعيد التحميل بس إذا تغيّر mtime/الحجم للملف وتغيّر الـ hash فعلاً، أو عبر reload().
+    - يحسب hits و reloads و disk_reads حتى نتأكد إن القراءة من القرص اختفت تحت الضغط.
+    """
+
+    def __init__(self, path, check_interval=ZONES_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._zones = {}
+        self._zone_names = []
+        # (zones, keys, matcher) ينبدل كله مرة وحدة: القارئ ياخذ نسخة وحدة متناسقة حتى لو صار تحميل بنفس اللحظة
+        self._match_state = ({}, [], None)
+        self._name_index = None
+        self._stat_key = None
+        self._digest = None
+        self._last_check = 0.0
+        self.loaded_at = None
+        self.hits = 0
+        self.reloads = 0
+        self.disk_reads = 0
+        self.errors = 0
+
+    def _file_stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load_locked(self, stat_key, force=False):
+        """قراءة الملف (داخل القفل). إذا المحتوى نفسه (نفس الـ hash) ما نعيد بناء شي."""
+        self._stat_key = stat_key
+        if stat_key is None:
+            if self._digest is not None:
+                print(f"Error loading delivery zones: {self.path} not found, keeping last loaded zones")
+            return
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            self.disk_reads += 1
+            digest = hashlib.sha1(raw).hexdigest()
+            if digest == self._digest and not force:
+                return
+            zones = json.loads(raw.decode("utf-8"))
+            if not isinstance(zones, dict):
+                raise ValueError("delivery zones file must contain a JSON object")
+        except Exception as e:
+            self.errors += 1
+            print(f"Error loading delivery zones: {e}")
+            return
+        self._zones = zones
+        self._digest = digest
+        self._rebuild_indexes()
+        self.reloads += 1
+        self.loaded_at = time.time()
+
+    def _rebuild_indexes(self):
+        """الفهارس المشتقة من القاموس — تنبني مرة وحدة بعد كل تحميل."""
+        self._zone_names = [str(k) for k in self._zones.keys() if k]
+        # آلة المطابقة تنبني أول ما نحتاجها (وتنعاد بعد كل تحميل جديد للملف)
+        self._match_state = (self._zones, list(self._zones.keys()), None)
+        self._name_index = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._digest is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if self._digest is not None and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            stat_key = self._file_stat_key()
+            if self._digest is None or stat_key != self._stat_key:
+                self._load_locked(stat_key)
+
+    def zones(self):
+        """القاموس الحالي {منطقة: سعر}. مشترك — لا تعدّل عليه."""
+        self._refresh()
+        self.hits += 1
+        return self._zones
+
+    def zone_names(self):
+        """أسماء المناطق (بدون الفارغة) بنفس ترتيب الملف."""
+        self._refresh()
+        self.hits += 1
+        return self._zone_names
+
+    def is_current(self, zones_dict):
+        """هل هذا القاموس هو نفس القاموس المحمّل حالياً بالسجل؟"""
+        return zones_dict is self._zones
+
+    def _match_snapshot(self):
+        """(zones, keys, matcher) من نفس التحميل؛ الـ matcher ينبني هنا إذا بعده ما انبنى."""
+        self._refresh()
+        self.hits += 1
+        state = self._match_state
+        if state[2] is None:
+            with self._lock:
+                state = self._match_state
+                if state[2] is None:
+                    state = (state[0], state[1], AhoCorasick(state[1]))
+                    self._match_state = state
+        return state
+
+    def longest_zone_in(self, text):
+        """أطول منطقة تظهر بالنص بمرور واحد (Aho-Corasick)، أو None."""
+        _, keys, matcher = self._match_snapshot()
+        idx = matcher.longest(text)
+        return keys[idx] if idx != -1 else None
+
+    def price_for(self, text):
+        """سعر التوصيل لأطول منطقة بالنص (المنطقة وسعرها من نفس التحميل)، أو 0."""
+        zones, keys, matcher = self._match_snapshot()
+        idx = matcher.longest(text)
+        return zones[keys[idx]] if idx != -1 else 0
+
+    def closest_zone_names(self, text, n, cutoff):
+        """أقرب أسماء المناطق للنص — نفس نتيجة difflib.get_close_matches لكن عبر فهرس الحروف."""
+        self._refresh()
+        self.hits += 1
+        index = self._name_index
+        if index is None:
+            with self._lock:
+                if self._name_index is None:
+                    self._name_index = NgramIndex(self._zone_names)
+                index = self._name_index
+        return index.get_close_matches(text, n=n, cutoff=cutoff)
+
+    def reload(self):
+        """إعادة تحميل إجبارية من الملف (مثلاً بعد تعديل يدوي)."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._load_locked(self._file_stat_key(), force=True)
+        return self._zones
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "zones": len(self._zones),
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "disk_reads": self.disk_reads,
+            "errors": self.errors,
+            "loaded_at": self.loaded_at,
+        }
+
+
+zone_registry = ZoneRegistry(ZONES_FILE)
+
 
 def load_delivery_zones():
-    """تحميل ملف المناطق وأسعار التوصيل."""
-    try:
-        os.makedirs(os.path.dirname(ZONES_FILE), exist_ok=True)
-        if os.path.exists(ZONES_FILE):
-            with open(ZONES_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading delivery zones: {e}")
-    return {}
+    """قاموس المناطق وأسعار التوصيل (من السجل بالذاكرة، بدون قراءة القرص بكل مرة)."""
+    return zone_registry.zones()
 
 
-def _longest_zone_in_text(text, zones_dict=None):
-    """يرجع أطول منطقة موجودة في النص (عشان كوت الصلحي ما يطابق الـ «الحي» أولاً وتطلع 3 بدل 5)."""
-    if not text or not str(text).strip():
-        return None
-    text = str(text).strip()
-    zones = zones_dict or load_delivery_zones()
+# logic_site_order يستورد الاسم القديم
+load_zones = load_delivery_zones
+
+
+def reload_delivery_zones():
+    """إعادة تحميل ملف المناطق فوراً بدون انتظار فحص التعديل."""
+    return zone_registry.reload()
+
+
+def get_zone_registry_stats():
+    return zone_registry.stats()
+
+
+def _longest_zone_in_text_scan(text, zones_dict):
+    """الطريقة القديمة: `zone in text` لكل منطقة. تبقى لقواميس من برة السجل وللمقارنة بالـ benchmark."""
     best_zone = None
-    for zone in zones.keys():
+    for zone in zones_dict.keys():
         if zone and zone in text:
             if best_zone is None or len(zone) > len(best_zone):
                 best_zone = zone
     return best_zone
 
 
+def _longest_zone_in_text(text, zones_dict=None):
+    """يرجع أطول منطقة موجودة في النص (عشان كوت الصلحي ما يطابق الـ «الحي» أولاً وتطلع 3 بدل 5)."""
+    if not text or not str(text).strip():
+        return None
+    text = str(text).strip()
+    if not zones_dict or zone_registry.is_current(zones_dict):
+        return zone_registry.longest_zone_in(text)
+    return _longest_zone_in_text_scan(text, zones_dict)
+
+
 def get_delivery_price(address):
     """استخراج سعر التوصيل بناءً على العنوان — نستخدم أطول منطقة مطابقة (كوت الصلحي قبل الحي)."""
-    delivery_zones = load_delivery_zones()
-    zone = _longest_zone_in_text(address, delivery_zones)
-    return delivery_zones[zone] if zone else 0
+    if not address or not str(address).strip():
+        return 0
+    # المنطقة وسعرها من نسخة وحدة للسجل: إعادة تحميل بالنص ما تطلع منطقة مو موجودة بالقاموس
+    return zone_registry.price_for(str(address).strip())
 
 
 def is_zone_known(address):
@@ -66,15 +242,11 @@ def get_closest_zone_names(text, n=6, cutoff=0.4):
     """
     if not text or not str(text).strip():
         return []
+    text_clean = str(text).strip()
     try:
-        delivery_zones = load_delivery_zones()
-        zone_names = [str(k) for k in delivery_zones.keys() if k]
+        return zone_registry.closest_zone_names(text_clean, n=n, cutoff=cutoff)
     except Exception:
         return []
-    if not zone_names:
-        return []
-    text_clean = str(text).strip()
-    return difflib.get_close_matches(text_clean, zone_names, n=n, cutoff=cutoff)
 
 
 def match_text_to_suggested_zones(text, suggested_zone_names, cutoff=0.8):
@@ -1,4 +1,12 @@
+import os
 import re
+import json
+import hashlib
+import threading
+import time
+from functools import lru_cache
+
+from features.aho_corasick import AhoCorasick
 
 
 _ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
@@ -9,84 +17,70 @@ def normalize_text(s: str) -> str:
         return ""
     s = s.translate(_ARABIC_DIGITS)
     s = s.replace("ـ", "")
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
+    # split() بدون وسيط يقسم على نفس فراغات \s ويشيل الأطراف
+    return " ".join(s.split())
 
-def parse_quantity_kg(text: str) -> float | None:
-    """
-    يحاول يستخرج الكمية بالكيلو من النص:
-    - ربع/نص/ثلاث ارباع
-    - كيلو/كيلوين/3ك/2 ك/1.5
-    - كيلو ونص / 1ك ونص / 1 ك ونص
-    يرجع None إذا ما لقى شيء.
-    """
-    t = normalize_text(text)
-    if not t:
-        return None
 
-    # مهم: لازم نلتقط "رقم + كسر" قبل ما نرجع للكسر لوحده،
-    # حتى لا يصير "2 ونص" يرجع 0.5 بدل 2.5.
-    m = re.search(
-        r"(\d+(?:\.\d+)?)\s*(?:ك|كغم|كيلو)?\s*(?:و\s*)?(?:نص|نصف)(?:ك)?\b",
-        t,
-    )
-    if m:
-        return float(m.group(1)) + 0.5
-
-    m = re.search(
-        r"(\d+(?:\.\d+)?)\s*(?:ك|كغم|كيلو)?\s*(?:و\s*)?(?:ربع)(?:ك)?\b",
-        t,
-    )
-    if m:
-        return float(m.group(1)) + 0.25
-
-    m = re.search(
-        r"(\d+(?:\.\d+)?)\s*(?:ك|كغم|كيلو)?\s*(?:و\s*)?(?:ثلاث\s*ارباع|ثلث\s*ارباع|3\s*ارباع)(?:ك)?\b",
-        t,
-    )
-    if m:
-        return float(m.group(1)) + 0.75
+_NUM = r"\d+(?:\.\d+)?"
+_UNIT = r"(?:ك|كغم|كيلو)"
 
+# قواعد الكمية بالترتيب (الأعلى أولوية أول): (النمط، كلمة لازم تكون بالنص، القيمة).
+# القيمة رقم ثابت، أو (إضافة) تنجمع على الرقم اللي ينلقط بالمجموعة v.
+# الكلمة المطلوبة جزء إجباري من النمط: إذا مو موجودة بالنص نتجاوز القاعدة بدون regex.
+# مهم: لازم نلتقط "رقم + كسر" قبل ما نرجع للكسر لوحده، حتى لا يصير "2 ونص" يرجع 0.5 بدل 2.5.
+_QUANTITY_RULES = (
+    (rf"(?P<v>{_NUM})\s*{_UNIT}?\s*(?:و\s*)?(?:نص|نصف)(?:ك)?\b", "نص", ("+", 0.5)),
+    (rf"(?P<v>{_NUM})\s*{_UNIT}?\s*(?:و\s*)?(?:ربع)(?:ك)?\b", "ربع", ("+", 0.25)),
+    (rf"(?P<v>{_NUM})\s*{_UNIT}?\s*(?:و\s*)?(?:ثلاث\s*ارباع|ثلث\s*ارباع|3\s*ارباع)(?:ك)?\b", "ارباع", ("+", 0.75)),
     # كلمات الكسور (نقبلها حتى لو ملتصقة مثل "ربعك")
-    if re.search(r"ربع\s*(?:ك|كيلو)?", t):
-        return 0.25
-
+    (r"ربع\s*(?:ك|كيلو)?", "ربع", 0.25),
     # ثلاث ارباع / 3 ارباع
-    if re.search(r"ثلاث\s*ارباع|3\s*ارباع|ثلث\s*ارباع", t):
-        return 0.75
-
+    (r"ثلاث\s*ارباع|3\s*ارباع|ثلث\s*ارباع", "ارباع", 0.75),
     # "كيلو ونص" وأشباهها (1.5 كغم)
-    if re.search(r"(كيلو|ك)\s*و?\s*نص", t):
-        return 1.5
-    if re.search(r"\b1\s*(كيلو|ك)\s*و?\s*نص\b", t):
-        return 1.5
-
-    # "كيلوين/كيلوَين" (2 كغم) و "ثلاث كيلو" (3 كغم)
-    if re.search(r"\bكيلوين\b", t):
-        return 2.0
-    if re.search(r"\bثلاث\s*كيلو\b", t):
-        return 3.0
-
+    (r"(?:كيلو|ك)\s*و?\s*نص", "نص", 1.5),
+    (r"\b1\s*(?:كيلو|ك)\s*و?\s*نص\b", "نص", 1.5),
+    # "كيلوين" (2 كغم) و "ثلاث كيلو" (3 كغم)
+    (r"\bكيلوين\b", "كيلوين", 2.0),
+    (r"\bثلاث\s*كيلو\b", "كيلو", 3.0),
     # "نص" لوحدها (نسمح مثل "نصك" و "نص ك")
-    if re.search(r"نص\s*(?:ك|كيلو)?", t):
-        return 0.5
-
+    (r"نص\s*(?:ك|كيلو)?", "نص", 0.5),
     # أرقام صريحة (1.5, 2, 3) مع ك/كيلو
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:ك|كغم|كيلو)\b", t)
-    if m:
-        return float(m.group(1))
-
+    (rf"(?P<v>{_NUM})\s*{_UNIT}\b", "", ("+", 0.0)),
     # رقم لوحده داخل النص (آخر حل)
-    m2 = re.search(r"\b(\d+(?:\.\d+)?)\b", t)
-    if m2:
-        return float(m2.group(1))
+    (rf"\b(?P<v>{_NUM})\b", "", ("+", 0.0)),
+)
+
+# تنترجم مرة وحدة عند تحميل الملف
+_QUANTITY_TABLE = tuple((re.compile(pattern), literal, value) for pattern, literal, value in _QUANTITY_RULES)
+
 
+def _parse_quantity_normalized(t: str) -> float | None:
+    """الكمية من نص مطبّع (normalize_text): أول قاعدة تطابق بالترتيب."""
+    if not t:
+        return None
+    for rx, literal, value in _QUANTITY_TABLE:
+        if literal and literal not in t:
+            continue
+        m = rx.search(t)
+        if m:
+            if isinstance(value, tuple):
+                return float(m.group("v")) + value[1]
+            return value
     return None
 
 
-def _match_meat_base(text: str) -> str | None:
-    t = normalize_text(text)
+def parse_quantity_kg(text: str) -> float | None:
+    """
+    يحاول يستخرج الكمية بالكيلو من النص:
+    - ربع/نص/ثلاث ارباع
+    - كيلو/كيلوين/3ك/2 ك/1.5
+    - كيلو ونص / 1ك ونص / 1 ك ونص
+    يرجع None إذا ما لقى شيء.
+    """
+    return _parse_quantity_normalized(normalize_text(text))
+
+
+def _meat_base_normalized(t: str) -> str | None:
     if not t:
         return None
 
@@ -106,6 +100,10 @@ def _match_meat_base(text: str) -> str | None:
     return None
 
 
+def _match_meat_base(text: str) -> str | None:
+    return _meat_base_normalized(normalize_text(text))
+
+
 DEFAULT_MEAT_PRICES_PER_KG = {
     "لحم عظم": {"buy": 13.0, "sell": 16.0},
     "شرح": {"buy": 14.0, "sell": 18.0},
@@ -114,6 +112,205 @@ DEFAULT_MEAT_PRICES_PER_KG = {
 }
 
 
+PRICES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "fixed_prices.json")
+
+# أقل مدة (بالثواني) بين فحصين لتاريخ تعديل ملف الأسعار
+PRICES_CHECK_INTERVAL = float(os.environ.get("PRICES_CHECK_INTERVAL", "2"))
+
+# الوحدات المدعومة بجداول الأسعار: بالكيلو (الكمية من parse_quantity_kg) أو بالقطعة (عدد)
+PRICE_UNITS = ("kg", "piece")
+
+# الجدول الافتراضي إذا ملف الأسعار مو موجود: نفس أصناف اللحم القديمة وبنفس أولوية المطابقة
+DEFAULT_PRICE_TABLES = {
+    "meat": {
+        "unit": "kg",
+        "items": [
+            {"name": "ضلوع", "keywords": ["ضلوع"], **DEFAULT_MEAT_PRICES_PER_KG["ضلوع"]},
+            {"name": "مثروم", "keywords": ["مثروم", "مفروم"], **DEFAULT_MEAT_PRICES_PER_KG["مثروم"]},
+            {"name": "شرح", "keywords": ["شرح", "شرائح"], **DEFAULT_MEAT_PRICES_PER_KG["شرح"]},
+            # "لحم" بدون توصيف نعتبره لحم عظم
+            {"name": "لحم عظم", "keywords": ["عظم", "لحم"], **DEFAULT_MEAT_PRICES_PER_KG["لحم عظم"]},
+        ],
+    },
+    "fish": {"unit": "kg", "items": []},
+    "veg": {"unit": "kg", "items": []},
+}
+
+_RE_COUNT = re.compile(rf"\b({_NUM})\b")
+
+
+class PriceTables:
+    """
+    جداول الأسعار (لحم/سمك/خضروات...) مترجمة لفهرس واحد:
+    كل الكلمات المفتاحية بآلة Aho-Corasick وحدة، والأولوية = ترتيب الأصناف بالملف ثم ترتيب العناصر،
+    فمرور واحد على نص المنتج يطلع العنصر الأعلى أولوية بدل سلسلة `in` و regex لكل صنف.
+
+    شكل الملف (JSON):
+    {
+      "<صنف>": {"unit": "kg" | "piece", "items": [
+          {"name": "...", "keywords": ["...", ...], "buy": 13.0, "sell": 16.0, "unit": "kg"}  (unit اختياري)
+      ]}
+    }
+    """
+
+    def __init__(self, tables, version=0):
+        if not isinstance(tables, dict):
+            raise ValueError("price tables must be a JSON object of categories")
+        self.version = version
+        self.items = []
+        patterns = []
+        owners = []
+        for category, spec in tables.items():
+            if not isinstance(spec, dict):
+                raise ValueError(f"price category {category!r} must be an object")
+            default_unit = spec.get("unit", "kg")
+            for item in spec.get("items", []):
+                unit = item.get("unit", default_unit)
+                if unit not in PRICE_UNITS:
+                    raise ValueError(f"unknown price unit {unit!r} for {item.get('name')!r}")
+                entry = {
+                    "base": str(item["name"]),
+                    "category": str(category),
+                    "unit": unit,
+                    "buy": float(item["buy"]),
+                    "sell": float(item["sell"]),
+                }
+                keywords = item.get("keywords") or [item["name"]]
+                for kw in keywords:
+                    kw = normalize_text(str(kw))
+                    if kw:
+                        patterns.append(kw)
+                        owners.append(len(self.items))
+                self.items.append(entry)
+        self._owners = owners
+        self._matcher = AhoCorasick(patterns)
+
+    def __len__(self):
+        return len(self.items)
+
+    def match(self, t: str) -> dict | None:
+        """العنصر الأعلى أولوية اللي تظهر أحد كلماته بالنص المطبّع، أو None."""
+        if not t:
+            return None
+        idx = self._matcher.first(t)
+        return self.items[self._owners[idx]] if idx != -1 else None
+
+    def suggest(self, product_text: str) -> dict | None:
+        t = normalize_text(product_text)
+        entry = self.match(t)
+        if entry is None:
+            return None
+        if entry["unit"] == "kg":
+            qty = _parse_quantity_normalized(t)
+        else:
+            m = _RE_COUNT.search(t)
+            qty = float(m.group(1)) if m else None
+        if qty is None:
+            qty = 1.0
+        qty = float(qty)
+        out = {
+            "base": entry["base"],
+            "category": entry["category"],
+            "unit": entry["unit"],
+            "qty": qty,
+            "buy_total": entry["buy"] * qty,
+            "sell_total": entry["sell"] * qty,
+        }
+        if entry["unit"] == "kg":
+            out["qty_kg"] = qty
+        return out
+
+
+class PriceTableRegistry:
+    """
+    جداول الأسعار بالذاكرة (واحدة للعملية كلها)، بنفس طريقة سجل المناطق:
+    تنقرأ وتترجم مرة وحدة، وتنعاد بس إذا تغيّر mtime/الحجم للملف وتغيّر الـ hash فعلاً، أو عبر reload().
+    كل تحميل ناجح يرفع version (مفتاح كاش الاقتراحات).
+    """
+
+    def __init__(self, path, check_interval=PRICES_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._tables = None
+        self._stat_key = None
+        self._digest = None
+        self._last_check = 0.0
+        self.version = 0
+        self.loaded_at = None
+        self.reloads = 0
+        self.errors = 0
+
+    def _file_stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _install_locked(self, raw_tables, digest):
+        tables = PriceTables(raw_tables, version=self.version + 1)
+        self._tables = tables
+        self._digest = digest
+        self.version = tables.version
+        self.reloads += 1
+        self.loaded_at = time.time()
+
+    def _load_locked(self, stat_key, force=False):
+        self._stat_key = stat_key
+        try:
+            if stat_key is None:
+                if self._tables is None:
+                    self._install_locked(DEFAULT_PRICE_TABLES, None)
+                else:
+                    print(f"Error loading price tables: {self.path} not found, keeping last loaded tables")
+                return
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()
+            if digest == self._digest and not force:
+                return
+            self._install_locked(json.loads(raw.decode("utf-8")), digest)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error loading price tables: {e}")
+            if self._tables is None:
+                self._install_locked(DEFAULT_PRICE_TABLES, None)
+
+    def tables(self) -> PriceTables:
+        now = time.monotonic()
+        if self._tables is not None and now - self._last_check < self.check_interval:
+            return self._tables
+        with self._lock:
+            if self._tables is None or now - self._last_check >= self.check_interval:
+                self._last_check = now
+                stat_key = self._file_stat_key()
+                if self._tables is None or stat_key != self._stat_key:
+                    self._load_locked(stat_key)
+            return self._tables
+
+    def reload(self) -> PriceTables:
+        """إعادة تحميل إجبارية من الملف (مثلاً بعد تعديل الأسعار)."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._load_locked(self._file_stat_key(), force=True)
+            return self._tables
+
+    def stats(self):
+        tables = self._tables
+        return {
+            "path": self.path,
+            "items": len(tables) if tables is not None else 0,
+            "version": self.version,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "loaded_at": self.loaded_at,
+        }
+
+
+price_registry = PriceTableRegistry(PRICES_FILE)
+
+
 def suggest_fixed_prices(product_text: str, price_table: dict | None = None) -> dict | None:
     """
     يرجع اقتراح:
@@ -124,8 +321,15 @@ def suggest_fixed_prices(product_text: str, price_table: dict | None = None) ->
       sell_total: float
     }
     أو None إذا المنتج مو ضمن الجدول.
+    بدون price_table نستعمل جداول ملف الأسعار (ومعها category و unit و qty؛ qty_kg بس للوحدة kg).
+    مع price_table ({صنف لحم: {buy, sell}}) نرجع للمطابقة القديمة على أصناف اللحم.
     """
-    base = _match_meat_base(product_text)
+    if price_table is None:
+        return price_registry.tables().suggest(product_text)
+
+    # تطبيع مرة وحدة للصنف والكمية
+    t = normalize_text(product_text)
+    base = _meat_base_normalized(t)
     if not base:
         return None
 
@@ -133,7 +337,7 @@ def suggest_fixed_prices(product_text: str, price_table: dict | None = None) ->
     if base not in table:
         return None
 
-    qty = parse_quantity_kg(product_text)
+    qty = _parse_quantity_normalized(t)
     if qty is None:
         qty = 1.0
 
@@ -146,3 +350,31 @@ def suggest_fixed_prices(product_text: str, price_table: dict | None = None) ->
         "sell_total": sell_per * float(qty),
     }
 
+
+# كم منتج نحتفظ باقتراح سعره بالذاكرة (الاقتراح يعتمد بس على نص المنتج ونسخة جداول الأسعار)
+SUGGESTION_CACHE_SIZE = int(os.environ.get("SUGGESTION_CACHE_SIZE", "4096"))
+
+
+@lru_cache(maxsize=SUGGESTION_CACHE_SIZE)
+def _cached_suggestion(product_text: str, tables: PriceTables) -> dict | None:
+    # الجداول (بالـ identity) جزء من المفتاح: بعد إعادة التحميل المفاتيح القديمة ما تنطلب وتطلع من الـ LRU
+    return tables.suggest(product_text)
+
+
+def cached_price_suggestion(product_text: str) -> dict | None:
+    """
+    suggest_fixed_prices بجداول ملف الأسعار مع LRU حسب نص المنتج ونسخة الجداول (للوحة اللي تعيد نفس المنتجات).
+    النتيجة مشتركة بين الاستدعاءات — لا تعدّل عليها.
+    """
+    return _cached_suggestion(product_text, price_registry.tables())
+
+
+def reload_price_tables():
+    """إعادة تحميل ملف الأسعار فوراً بدون انتظار فحص التعديل."""
+    tables = price_registry.reload()
+    _cached_suggestion.cache_clear()
+    return tables
+
+
+def get_price_tables_stats():
+    return {**price_registry.stats(), "cache": _cached_suggestion.cache_info()._asdict()}
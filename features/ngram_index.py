@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+فهرس حروف لاقتراح أقرب الأسماء بدون ما نمرّ على كل الأسماء بـ difflib.
+
+كل اسم ينقسم إلى حروف مع رقم تكرارها (مثلاً «كوكب» → (ك،1) (و،1) (ك،2) (ب،1)).
+عدد الحروف المشتركة هو الحد الأعلى اللي يستعمله difflib نفسه (quick_ratio)،
+فأي اسم نسبته ≥ cutoff لازم يشترك بعدد كافي منها — ونلقاه من الفهرس (prefix filtering)
+بدون ما نفحص الأسماء اللي ما تشترك. القائمة المختصرة ترتب بـ SequenceMatcher.ratio()
+بنفس طريقة difflib.get_close_matches، فالنتيجة نفسها بالضبط.
+ونفس الحد الأعلى يخلينا نوقف بدري: إذا حد الاسم الجاي أقل من أضعف نتيجة بالـ n الأفضل، الباقي ما يدخل.
+"""
+import heapq
+import math
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+
+def _char_tokens(text):
+    seen = {}
+    tokens = []
+    for ch in text:
+        k = seen.get(ch, 0) + 1
+        seen[ch] = k
+        tokens.append((ch, k))
+    return tokens
+
+
+class NgramIndex:
+    """فهرس مبني مرة وحدة من قائمة أسماء (تنعاد بنايته إذا تغيّرت القائمة)."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._lengths = [len(x) for x in self.names]
+        self._token_sets = []
+        postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            tokens = _char_tokens(name)
+            self._token_sets.append(frozenset(tokens))
+            for tok in tokens:
+                postings[tok].append(i)
+        self._postings = dict(postings)
+
+    def __len__(self):
+        return len(self.names)
+
+    def shortlist(self, text, cutoff):
+        """
+        الأسماء اللي ممكن نسبتها توصل cutoff، مع الحد الأعلى لنسبتها:
+        قائمة (الحد الأعلى، رقم الاسم) بدون ما نحسب ratio.
+        """
+        tokens = _char_tokens(text)
+        la = len(tokens)
+        lengths, token_sets = self._lengths, self._token_sets
+        query = frozenset(tokens)
+        if cutoff <= 0:
+            candidates = range(len(self.names))
+        else:
+            # أقل عدد حروف مشتركة ممكن يعطي النسبة المطلوبة (أقصر اسم = حرف واحد)
+            need = max(1, math.ceil(cutoff * (la + 1) / 2.0 - 1e-9))
+            if need > la:
+                return []
+            postings = self._postings
+            tokens.sort(key=lambda t: len(postings.get(t, ())))
+            candidates = set()
+            for tok in tokens[:la - need + 1]:
+                candidates.update(postings.get(tok, ()))
+        out = []
+        for i in candidates:
+            bound = 2.0 * len(token_sets[i] & query) / (la + lengths[i]) if la + lengths[i] else 0.0
+            if bound >= cutoff:
+                out.append((bound, i))
+        return out
+
+    def get_close_matches(self, word, n=3, cutoff=0.6):
+        """
+        نفس difflib.get_close_matches(word, names, n, cutoff) لكن على القائمة المختصرة فقط.
+        نحسب ratio من الأعلى حداً للأقل، ونوقف لمن الحد الأعلى للباقي يصير أقل من أضعف نتيجة بالـ n الأفضل.
+        """
+        if not n > 0:
+            raise ValueError("n must be > 0: %r" % (n,))
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError("cutoff must be in [0.0, 1.0]: %r" % (cutoff,))
+        candidates = self.shortlist(word, cutoff)
+        candidates.sort(reverse=True)
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        names = self.names
+        top = []  # heap بأفضل n نتيجة (score, name)
+        for bound, i in candidates:
+            if len(top) == n and bound < top[0][0]:
+                break
+            x = names[i]
+            s.set_seq1(x)
+            if s.real_quick_ratio() >= cutoff and s.quick_ratio() >= cutoff:
+                score = s.ratio()
+                if score >= cutoff:
+                    if len(top) < n:
+                        heapq.heappush(top, (score, x))
+                    elif (score, x) > top[0]:
+                        heapq.heapreplace(top, (score, x))
+        return [x for score, x in sorted(top, reverse=True)]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+أرقام الموبايل العراقية: استخراج وتطبيع بمكان واحد (بدل ثلاث نسخ بـ main و logic_old و logic_site_order).
+
+الشكل الموحّد للرقم: 07XXXXXXXXX (11 رقم إنكليزي). أي شي ثاني = مو رقم → None.
+المقبول بالنص:
+- 07XXXXXXXXX أو 7XXXXXXXXX (بدون الصفر)
+- +964 / 00964 / 964 قبل الرقم (ومعها صفر زايد مثل +964 0771...)
+- أرقام عربية (٠-٩) أو فارسية (۰-۹)
+- فواصل داخل الرقم: مسافة، -، .، أقواس (مو سطر جديد — الرقم لازم يكون بسطر واحد)
+الرقم الأطول أو الأقصر من المطلوب (مثلاً 12 رقم يبدأ بـ 07) ما ينقبل.
+"""
+import re
+
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+# translate على نص عربي مكلف — نسويه بس إذا بالنص أرقام عربية/فارسية
+_RE_LOCAL_DIGIT = re.compile("[٠-٩۰-۹]")
+_SEP = r"[ \t\u00a0\-.()]*"
+# مجموعة 1 = الرقم من الـ 7 (مع الفواصل)؛ البادئة (+964 / 00964 / 964 / 0) اختيارية.
+# الـ lookahead بالبداية يخلي المحرك يتجاوز أي موضع ما يبدأ بـ + أو 0 أو 7 أو 9 بفحص حرف واحد.
+_RE_PHONE = re.compile(
+    rf"(?=[+079])(?<![0-9])(?:(?:(?:\+|00){_SEP})?964{_SEP}(?:0{_SEP})?|0{_SEP})?(7(?:{_SEP}[0-9]){{9}})(?![0-9])"
+)
+_RE_NON_DIGIT = re.compile(r"[^0-9]")
+
+
+def _search(text):
+    if not text:
+        return None, None
+    t = text.translate(_DIGITS) if _RE_LOCAL_DIGIT.search(text) else text
+    # أغلب الأسطر (منتجات، عنوان) ما بيها 7 أصلاً
+    if "7" not in t:
+        return None, None
+    m = _RE_PHONE.search(t)
+    if m is None:
+        return None, None
+    return m, t
+
+
+def _canonical(m):
+    return "0" + _RE_NON_DIGIT.sub("", m.group(1))
+
+
+def extract_phone(text):
+    """أول رقم موبايل بالنص بالشكل الموحّد 07XXXXXXXXX، أو None."""
+    m, _ = _search(text)
+    return _canonical(m) if m is not None else None
+
+
+def normalize_phone(phone_str):
+    """تطبيع رقم مكتوب لوحده (مثلاً رد الزبون «+964 771 234 5678»)؛ نفس extract_phone."""
+    return extract_phone((phone_str or "").strip())
+
+
+def find_phone_line(lines):
+    """
+    أول رقم موبايل بأسطر الرسالة (مرور واحد على الرسالة كلها) ورقم سطره:
+    (رقم، index) أو (None, None).
+    """
+    text = "\n".join(lines)
+    m, t = _search(text)
+    if m is None:
+        return None, None
+    return _canonical(m), t.count("\n", 0, m.start(1))
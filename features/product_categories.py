@@ -2,6 +2,9 @@
 """تصنيف المنتجات: سمك، خضروات وفواكه (حسب ملفات data)."""
 import os
 import re
+from functools import lru_cache
+
+from features.aho_corasick import AhoCorasick
 
 _BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 _VEG_FILE = os.path.join(_BASE_DIR, "data", "vegetables_fruits.txt")
@@ -11,6 +14,13 @@ _MEAT_FILE = os.path.join(_BASE_DIR, "data", "meat_types.txt")
 _veg_words = None
 _fish_words = None
 _meat_words = None
+_classifier = None
+
+# ترتيب الأولوية عند تطابق أكثر من صنف (نفس ترتيب اللوحة: لحم ثم سمك ثم خضروات)
+CATEGORY_PRIORITY = ("meat", "fish", "veg")
+
+# كم منتج نحتفظ بتصنيفه بالذاكرة (التصنيف يعتمد بس على نص المنتج)
+PRODUCT_CATEGORY_CACHE_SIZE = int(os.environ.get("PRODUCT_CATEGORY_CACHE_SIZE", "4096"))
 
 
 def _load_lines(filepath):
@@ -88,12 +98,71 @@ def is_fish(product_name):
     return False
 
 
+class CategoryClassifier:
+    """
+    مصنّف واحد مبني من ملفات اللحم والسمك والخضروات: كل كلمة بالآلة معلّمة بصنفها (bit)،
+    فمرور واحد على نص المنتج يكفي بدل ثلاث لوبات (is_meat ثم is_fish ثم is_vegetable_fruit).
+    """
+
+    _MEAT, _FISH, _VEG = 1, 2, 4
+
+    def __init__(self, meat_words, fish_words, veg_words):
+        patterns = []
+        masks = []
+        # الكلمة المكررة بأكثر من ملف تاخذ صنف الملف الأعلى أولوية (أول ظهور)
+        for mask, words in ((self._MEAT, meat_words), (self._FISH, fish_words), (self._VEG, veg_words)):
+            for w in words:
+                patterns.append(w)
+                masks.append(mask)
+        self._matcher = AhoCorasick(patterns)
+        self._node_masks = self._matcher.node_masks(masks)
+
+    def classify(self, product_name):
+        """"meat" / "fish" / "veg" / "unknown" — نفس نتيجة الدوال الثلاث بالترتيب."""
+        if not product_name or not product_name.strip():
+            return "unknown"
+        p = product_name.strip()
+        # أول ما تطلع كلمة لحم نوقف — اللحم أعلى أولوية
+        found = self._matcher.scan_mask(p, self._node_masks, stop_mask=self._MEAT)
+        if found & self._MEAT:
+            return "meat"
+        if found & self._FISH or p.startswith("سمك"):
+            return "fish"
+        if found & self._VEG:
+            return "veg"
+        return "unknown"
+
+
+def _get_classifier():
+    global _classifier
+    if _classifier is None:
+        _classifier = CategoryClassifier(_get_meat_words(), _get_fish_words(), _get_veg_words())
+    return _classifier
+
+
+@lru_cache(maxsize=PRODUCT_CATEGORY_CACHE_SIZE)
+def product_category(product_name):
+    """
+    تصنيف المنتج للوحة: "meat" أو "fish" أو "veg" أو "unknown" (الأولوية: لحم ثم سمك ثم خضروات).
+    النتيجة محفوظة بـ LRU حسب نص المنتج، وتنمسح مع reload_categories().
+    """
+    return _get_classifier().classify(product_name)
+
+
+def classify_many(products):
+    """تصنيف مجموعة منتجات مرة وحدة (كل منتج مكرر ينحسب مرة): يرجع {منتج: صنف}."""
+    return {p: product_category(p) for p in dict.fromkeys(products)}
+
+
 def reload_categories():
     """إعادة تحميل القوائم من الملفات (مفيد بعد تعديل الملفات)."""
-    global _veg_words, _fish_words, _meat_words
+    global _veg_words, _fish_words, _meat_words, _classifier
     _veg_words = None
     _fish_words = None
     _meat_words = None
+    _classifier = None
+    product_category.cache_clear()
     _get_veg_words()
     _get_fish_words()
     _get_meat_words()
+    _get_classifier()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+تحليل رسالة طلب المتجر الإلكتروني (اسم الزبون، العنوان، النقطة الدالة، المنتجات، السعر الكلي).
+
+كل سطر يتصنف مرة وحدة بنمط واحد مترجم (بدل سلسلة re.match/re.search لكل سطر):
+- نوع السطر بمجموعة مسمّاة (customer / address / landmark / skip / product) بنفس أولوية الـ if القديمة؛
+  «السعر الكلي» (بأي مكان بالسطر) يتفحص بـ `in` بين skip و product لأن `.*` بالنمط يرجع على كل سطر.
+- ومعها lookahead اختياري يلقط «الكمية: N» أو «السعر: N» بغض النظر عن النوع،
+  فسطري الكمية والسعر بعد اسم المنتج نقرأهم من التصنيف بدون ما نعيد فحصهم.
+"""
+import re
+
+# مجموعة lastgroup = نوع السطر (المجموعات الداخلية تنسد قبلها)؛ qty/price متاحة دائماً عبر group()
+_RE_SITE_LINE = re.compile(
+    r"^(?:(?=الكمية\s*[:：]\s*(?P<qty>\d+))|(?=السعر\s*[:：]\s*(?P<price>\d+)))?"
+    r"(?:"
+    r"(?P<customer>اسم\s*الزبون\s*[:：]\s*(?P<customer_value>.*))"
+    r"|(?P<address>العنوان\s*[:：]\s*(?P<address_value>.*))"
+    r"|(?P<landmark>اقرب\s*نقطة\s*دالة\s*[:：]\s*(?P<landmark_value>.*))"
+    r"|(?P<skip>ملاحظات|(?:\*\*|\*\*\*|\*\*\*\*\*\*|معلومات الطلب)?$|-+$)"
+    r"|(?P<product>الاسم\s*[:：]\s*(?P<product_name>.+))"
+    r")?"
+)
+# الأنواع اللي أولويتها أعلى من سطر السعر الكلي
+_HEADER_KINDS = frozenset(("customer", "address", "landmark", "skip"))
+_TOTAL_MARK = "السعر الكلي"
+_RE_SHOP_PREFIX = re.compile(r"^اسم\s*المحل(?:\s*[:：]\s*|\s+)")
+
+
+def _star_digits(line: str) -> str:
+    return line.replace("*", "").strip()
+
+
+def parse_site_order_message(text: str):
+    """تحليل نص طلب الموقع: اسم الزبون، العنوان، النقطة الدالة، المنتجات (الاسم + الكمية + السعر فقط)."""
+    if not text:
+        return None
+    lines = [l.strip() for l in text.splitlines()]
+    classified = [_RE_SITE_LINE.match(l) for l in lines]
+    customer_name = ""
+    address = ""
+    landmark = ""
+    items = []
+    total_price = None
+    i = 0
+    n = len(lines)
+    while i < n:
+        m = classified[i]
+        kind = m.lastgroup
+        if kind not in _HEADER_KINDS and _TOTAL_MARK in lines[i]:
+            kind = "total"
+        if kind == "customer":
+            value = m.group("customer_value").strip()
+            if value:
+                customer_name = value
+        elif kind == "address":
+            value = m.group("address_value").strip()
+            if value:
+                address = value
+        elif kind == "landmark":
+            value = m.group("landmark_value").strip()
+            if value:
+                landmark = value
+        elif kind == "total":
+            try:
+                rest = _star_digits(lines[i].replace(_TOTAL_MARK, ""))
+                if rest.isdigit():
+                    total_price = int(rest)
+                elif i + 1 < n and _star_digits(lines[i + 1]).isdigit():
+                    total_price = int(_star_digits(lines[i + 1]))
+                elif i + 2 < n and _star_digits(lines[i + 2]).isdigit():
+                    total_price = int(_star_digits(lines[i + 2]))
+            except ValueError:
+                pass
+        elif kind == "product":
+            name = m.group("product_name").strip()
+            shop = _RE_SHOP_PREFIX.match(name)
+            if shop:
+                name = name[shop.end():].strip()
+            qty = 1
+            price = 0
+            if i + 1 < n and classified[i + 1].group("qty") is not None:
+                qty = int(classified[i + 1].group("qty"))
+            if i + 2 < n and classified[i + 2].group("price") is not None:
+                price = int(classified[i + 2].group("price"))
+            if name and name != "اسم المحل":
+                items.append({"name": name, "qty": qty, "price": price})
+            i += 1
+            if i < n and classified[i].group("qty") is not None:
+                i += 1
+            if i < n and classified[i].group("price") is not None:
+                i += 1
+            continue
+        i += 1
+    return {
+        "customer_name": customer_name,
+        "address": address,
+        "landmark": landmark,
+        "items": items,
+        "total_price": total_price,
+    }
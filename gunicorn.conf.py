@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+إعدادات gunicorn للوحة بوضع الإنتاج (بدل app.run سيرفر التطوير):
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+- WEB_CONCURRENCY: عدد العمليات (workers). كل عملية عندها pool اتصالات (DB_POOL_MAX) ونسخة مخزن طلبات
+  تتزامن عبر LISTEN/NOTIFY، فانتبه: workers × DB_POOL_MAX لازم ما يتجاوز حد اتصالات قاعدة البيانات.
+- WEB_THREADS: threads بكل عملية (gthread). كل متصفح مفتوح على /api/stream (SSE) ياخذ thread طول ما هو مفتوح.
+- SSE_MAX_CONNECTIONS: حد البثوث المفتوحة بكل عملية (افتراضياً نص WEB_THREADS، يعني 4 من 8)، فالباقي يضل
+  لطلبات الـ API. المتصفح الزايد ياخذ busy ويستعلم كل 10 ثواني ويرجع يجرب البث بعد SSE_BUSY_RETRY_MS.
+  الحد الكلي = workers × SSE_MAX_CONNECTIONS؛ تريد لوحات أكثر مفتوحة؟ زيد WEB_THREADS (والحد يزيد وياه).
+- WEB_GRACEFUL_TIMEOUT: بعد SIGTERM كم ثانية تخلص الطلبات الشغالة قبل القتل.
+init_db يشتغل مرة وحدة بالـ master (preload_app) قبل ما تنولد العمليات.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+timeout = int(os.environ.get("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+preload_app = True
+accesslog = "-"
+
+
+def pre_fork(server, worker):
+    # اتصالات الـ master (من init_db) ما تنشارك ويا العمليات بعد fork — نسكرها قبل
+    from db import db_pool
+    if db_pool is not None:
+        db_pool.closeall()
+
+
+def worker_exit(server, worker):
+    from db import db_pool
+    from persistence import order_persistence
+    order_persistence.close()
+    if db_pool is not None:
+        db_pool.closeall()
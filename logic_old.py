@@ -14,45 +14,22 @@
 
 ما يزال main يوجّه الرسائل التي لا تبدأ بـ «اسم الزبون: » إلى هذا الملف فقط.
 """
+import asyncio
 import json
 import logging
-import re
-import uuid
-from datetime import datetime, timezone
+import threading
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TimedOut
 from telegram.ext import ContextTypes, ConversationHandler
 
-logger = logging.getLogger(__name__)
-
+from async_db import instrument_handler, run_db
+from persistence import PERSIST_WINDOW
+from repository import order_repository
+from telegram_outbox import telegram_outbox
+from features.phone_numbers import find_phone_line
 
-def _extract_phone_from_text(text: str):
-    """
-    استخراج رقم عراقي من سطر نصي مع تطبيع بسيط:
-    - إزالة كل ما ليس رقم
-    - +964 / 964 → 0 ثم بقية الرقم
-    - التعامل مع 07xxxxxxxx و 7xxxxxxxx
-    """
-    if not text:
-        return None
-
-    digits = re.sub(r"[^0-9]", "", text)
-    if not digits:
-        return None
-
-    # +964 أو 964 في البداية
-    if digits.startswith("964") and len(digits) >= 12:
-        return "0" + digits[3:]
-
-    # 07xxxxxxxx أو أطول قليلاً
-    if digits.startswith("07") and len(digits) >= 10:
-        return digits[:11] if len(digits) >= 11 else digits
-
-    # 7xxxxxxxx → 07xxxxxxxx
-    if len(digits) == 9 and digits.startswith("7"):
-        return "0" + digits
-
-    return None
+logger = logging.getLogger(__name__)
 
 
 def _parse_flexible_order_lines(lines):
@@ -63,16 +40,7 @@ def _parse_flexible_order_lines(lines):
     - البقية تعتبر منتجات.
     يرجع (title, phone_number, products)
     """
-    phone_idx = None
-    phone_number = None
-
-    for i, line in enumerate(lines):
-        candidate = _extract_phone_from_text(line)
-        if candidate:
-            phone_idx = i
-            phone_number = candidate
-            break
-
+    phone_number, phone_idx = find_phone_line(lines)
     if phone_idx is None:
         return None, None, []
 
@@ -108,17 +76,94 @@ def _parse_flexible_order_lines(lines):
     return title, phone_number, products
 
 
+# الطلبات اللي انشالت من المخزن وبعد رسائلها ما انشالت من الفهرس (تنضاف من أي thread)
+_forgotten_orders = set()
+_forget_lock = threading.Lock()
+_delete_hook_installed = False
+_index_pruned = False
+
+
+def _forget_orders(bot_data, order_ids=None):
+    """رسائل الطلبات المحذوفة/المؤرشفة تنشال من الفهرس العكسي و last_button_message (بالـ loop مال البوت)."""
+    with _forget_lock:
+        order_ids = set(order_ids or ()) | _forgotten_orders
+        _forgotten_orders.clear()
+    if not order_ids:
+        return
+    index = _message_index(bot_data)
+    for key in [k for k, oid in index.items() if oid in order_ids]:
+        del index[key]
+    last_button_message = bot_data.get("last_button_message", {})
+    for oid in order_ids:
+        last_button_message.pop(oid, None)
+
+
+def _install_delete_hook(bot_data, loop):
+    """
+    أي طلب ينشال من المخزن (حذف من اللوحة، تصفير، أرشفة، أو مزامنة من عملية ثانية) تنشال رسائله من الفهرس.
+    الـ hook يجي من thread المخزن: نجمع الأرقام ونرجعها للـ loop بنداء واحد.
+    """
+    def on_delete(order_id):
+        with _forget_lock:
+            first = not _forgotten_orders
+            _forgotten_orders.add(order_id)
+        if first:
+            loop.call_soon_threadsafe(_forget_orders, bot_data)
+
+    order_repository.add_delete_hook(on_delete)
+
+
+async def _repository(context):
+    """
+    مخزن الطلبات المشترك ويا اللوحة؛ bot_data["orders"/"pricing"/"invoice_numbers"] تصير قواميسه.
+    استدعاءات المخزن تلمس قاعدة البيانات: من الـ handlers تروح بـ run_db.
+    """
+    global _delete_hook_installed, _index_pruned
+    bot_data = context.application.bot_data
+    if not _delete_hook_installed:
+        _delete_hook_installed = True
+        _install_delete_hook(bot_data, asyncio.get_running_loop())
+    await run_db(order_repository.attach, bot_data)
+    if not _index_pruned:
+        # فهرس محفوظ من قبل: رسائل طلبات انحذفت أو تأرشفت والبوت واكف
+        known = await run_db(order_repository.order_ids)
+        if known is not None:
+            _index_pruned = True
+            index_orders = set(_message_index(bot_data).values()) | set(bot_data.get("last_button_message", {}))
+            _forget_orders(bot_data, index_orders - known)
+    return order_repository
+
+
 def _get_invoice_number(context):
-    """استدعاء دالة رقم الفاتورة من bot_data (معرّفة في main)."""
+    """
+    رقم الفاتورة للطلب الجديد. مع قاعدة البيانات None: الرقم ينسحب من invoice_seq وقت إدخال الطلب
+    (نفس أرقام طلبات الموقع، ذري وما يتكرر). بدونها نرجع لدالة رقم الفاتورة من bot_data (معرّفة في main).
+    """
+    if order_repository.enabled:
+        return None
     fn = context.application.bot_data.get("get_invoice_number")
     return fn() if fn else 0
 
 
 def _save_data_in_background(context):
-    """جدولة الحفظ من bot_data (معرّف في main)."""
-    fn = context.application.bot_data.get("save_data_in_background")
-    if fn:
-        context.application.create_task(fn(context))
+    """
+    حفظ باقي bot_data (رسائل الأزرار، فهرس الرسائل...) بعد تغيير.
+    الطلبات نفسها مو هنا: كل إنشاء/تعديل/حذف يروح عن طريق order_repository وينكتب منه
+    (وتعديل مباشر على bot_data["orders"/"pricing"] لازم يتبعه order_repository.touch(order_id)).
+    دالة الحفظ الكاملة (معرّفة في main) ما تنجدول أكثر من مرة وحدة بكل نافذة PERSIST_WINDOW —
+    الاستدعاءات ورا بعض تندمج بحفظة وحدة.
+    """
+    bot_data = context.application.bot_data
+    fn = bot_data.get("save_data_in_background")
+    if fn and not bot_data.get("_save_scheduled"):
+        bot_data["_save_scheduled"] = True
+
+        async def _debounced_save():
+            await asyncio.sleep(PERSIST_WINDOW)
+            bot_data["_save_scheduled"] = False
+            await fn(context)
+
+        context.application.create_task(_debounced_save())
 
 
 def _delete_message_in_background(context, chat_id, message_id):
@@ -128,6 +173,36 @@ def _delete_message_in_background(context, chat_id, message_id):
         context.application.create_task(fn(context, chat_id=chat_id, message_id=message_id))
 
 
+def _message_key(chat_id, message_id):
+    # نص مو tuple حتى bot_data يبقى ينحفظ JSON
+    return f"{chat_id}:{message_id}"
+
+
+def _message_index(bot_data):
+    """
+    فهرس عكسي «chat_id:message_id» → order_id لرسائل الطلبات (رسالة الطلب نفسها ورسالة الأزرار)،
+    حتى تعديل رسالة يلقى طلبه مباشرة بدل المرور على كل last_button_message.
+    إذا ما موجود (مثلاً bot_data محمّل من حفظ قديم) ينبني مرة من last_button_message.
+    """
+    index = bot_data.get("message_order_index")
+    if index is None:
+        index = {}
+        for oid, msg_info in bot_data.get("last_button_message", {}).items():
+            if msg_info:
+                index[_message_key(msg_info["chat_id"], msg_info["message_id"])] = oid
+        bot_data["message_order_index"] = index
+    return index
+
+
+def _index_message(bot_data, chat_id, message_id, order_id):
+    _message_index(bot_data)[_message_key(chat_id, message_id)] = order_id
+
+
+def _unindex_message(bot_data, chat_id, message_id):
+    _message_index(bot_data).pop(_message_key(chat_id, message_id), None)
+
+
+@instrument_handler
 async def receive_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """استلام رسالة الطلبية بالصيغة القديمة (عنوان، رقم، منتجات)."""
     try:
@@ -143,12 +218,10 @@ async def receive_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 
+@instrument_handler
 async def process_order(update, context, message, edited=False):
     """معالجة نص الطلبية: عنوان، رقم، قائمة منتجات (بترتيب مرن للأسطر)."""
-    orders = context.application.bot_data["orders"]
-    pricing = context.application.bot_data["pricing"]
-    invoice_numbers = context.application.bot_data["invoice_numbers"]
-    last_button_message = context.application.bot_data["last_button_message"]
+    repo = await _repository(context)
 
     user_id = str(message.from_user.id)
     lines = [line.strip() for line in message.text.strip().split("\n") if line.strip()]
@@ -180,45 +253,26 @@ async def process_order(update, context, message, edited=False):
     is_new_order = True
 
     if edited:
-        for oid, msg_info in last_button_message.items():
-            if msg_info and msg_info.get("message_id") == message.message_id and str(msg_info.get("chat_id")) == str(message.chat_id):
-                if oid in orders:
-                    order_id = oid
-                    is_new_order = False
-                    logger.info(f"Found existing order {order_id} based on message ID (edited message).")
-                    break
-                else:
-                    logger.warning(f"Message ID {message.message_id} found in last_button_message but order {oid} is missing. Treating as new.")
-                    order_id = None
+        oid = _message_index(context.application.bot_data).get(_message_key(message.chat_id, message.message_id))
+        if oid is not None:
+            if (await run_db(repo.get_order, oid))[0] is not None:
+                order_id = oid
+                is_new_order = False
+                logger.info(f"Found existing order {order_id} based on message ID (edited message).")
+            else:
+                logger.warning(f"Message ID {message.message_id} found in message index but order {oid} is missing. Treating as new.")
+                _unindex_message(context.application.bot_data, message.chat_id, message.message_id)
 
     if not order_id:
-        order_id = str(uuid.uuid4())[:8]
-        invoice_no = _get_invoice_number(context)
-        orders[order_id] = {
-            "user_id": user_id,
-            "title": title,
-            "phone_number": phone_number,
-            "products": products,
-            "places_count": 0,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-        }
-        pricing[order_id] = {p: {} for p in products}
-        invoice_numbers[order_id] = invoice_no
+        order = await run_db(repo.create_order, title, phone_number, products,
+                             user_id=user_id, invoice_no=_get_invoice_number(context))
+        order_id = order["id"]
+        # تعديل رسالة الطلب لاحقاً يحدّث نفس الطلب
+        _index_message(context.application.bot_data, message.chat_id, message.message_id, order_id)
         logger.info(f"Created new order {order_id} for user {user_id}.")
     else:
-        old_products = set(orders[order_id].get("products", []))
-        new_products = set(products)
-        orders[order_id]["title"] = title
-        orders[order_id]["phone_number"] = phone_number
-        orders[order_id]["products"] = products
-        for p in new_products:
-            if p not in pricing.get(order_id, {}):
-                pricing.setdefault(order_id, {})[p] = {}
-        if order_id in pricing:
-            for p in old_products - new_products:
-                if p in pricing[order_id]:
-                    del pricing[order_id][p]
-                    logger.info(f"Removed pricing for product '{p}' from order {order_id}.")
+        for p in await run_db(repo.update_order, order_id, title, phone_number, products) or []:
+            logger.info(f"Removed pricing for product '{p}' from order {order_id}.")
         logger.info(f"Updated existing order {order_id}. Initiator: {user_id}.")
 
     _save_data_in_background(context)
@@ -236,6 +290,7 @@ async def process_order(update, context, message, edited=False):
         )
 
 
+@instrument_handler
 async def create_order_from_site_data(chat_id, context, user_id, order_data, phone):
     """
     إنشاء طلبية من بيانات طلب الموقع (اسم الزبون...) كطلب عادي وعرض أزرار التسعير.
@@ -243,9 +298,7 @@ async def create_order_from_site_data(chat_id, context, user_id, order_data, pho
     phone: رقم معدّل (بعد تطبيع +964 والمسافات).
     """
     user_id = str(user_id)
-    orders = context.application.bot_data["orders"]
-    pricing = context.application.bot_data["pricing"]
-    invoice_numbers = context.application.bot_data["invoice_numbers"]
+    repo = await _repository(context)
 
     title = (order_data.get("address") or "").strip() or "طلب موقع"
     items = order_data.get("items") or []
@@ -255,18 +308,9 @@ async def create_order_from_site_data(chat_id, context, user_id, order_data, pho
         await context.bot.send_message(chat_id=chat_id, text="ما في منتجات بالطلب.")
         return
 
-    order_id = str(uuid.uuid4())[:8]
-    invoice_no = _get_invoice_number(context)
-    orders[order_id] = {
-        "user_id": user_id,
-        "title": title,
-        "phone_number": phone,
-        "products": products,
-        "places_count": 0,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-    }
-    pricing[order_id] = {p: {} for p in products}
-    invoice_numbers[order_id] = invoice_no
+    order = await run_db(repo.create_order, title, phone, products,
+                         user_id=user_id, invoice_no=_get_invoice_number(context))
+    order_id = order["id"]
     _save_data_in_background(context)
     logger.info(f"Created site order {order_id} for user {user_id}.")
 
@@ -278,18 +322,18 @@ async def create_order_from_site_data(chat_id, context, user_id, order_data, pho
     await show_buttons(chat_id, context, user_id, order_id)
 
 
+@instrument_handler
 async def show_buttons(chat_id, context, user_id, order_id, confirmation_message=None):
     """عرض أزرار تسعير الطلبية (المنطق القديم)."""
-    orders = context.application.bot_data["orders"]
-    pricing = context.application.bot_data["pricing"]
     last_button_message = context.application.bot_data["last_button_message"]
 
     try:
-        if order_id not in orders:
+        repo = await _repository(context)
+        order, prices, _ = await run_db(repo.get_order, order_id)
+        if order is None:
             await context.bot.send_message(chat_id=chat_id, text="❌ الطلب غير موجود.")
             return
 
-        order = orders[order_id]
         final_buttons_list = []
         final_buttons_list.append([
             InlineKeyboardButton("➕ إضافة منتج", callback_data=f"add_product_to_order_{order_id}"),
@@ -304,7 +348,7 @@ async def show_buttons(chat_id, context, user_id, order_id, confirmation_message
 
         for i, p_name in enumerate(order["products"]):
             callback_data_for_product = f"{order_id}|{i}"
-            is_priced = p_name in pricing.get(order_id, {}) and "buy" in pricing[order_id].get(p_name, {})
+            is_priced = "buy" in prices.get(p_name, {})
             if is_priced:
                 button_text = f"✏️✅ {p_name}" if p_name in edited_list else f"✅ {p_name}"
                 completed_products_buttons.append([InlineKeyboardButton(button_text, callback_data=callback_data_for_product)])
@@ -327,24 +371,36 @@ async def show_buttons(chat_id, context, user_id, order_id, confirmation_message
         status_text = "🔧 وضع التعديل حالياً" if editing_mode else "📝 تسعير الطلب"
         message_text += f"*{status_text}* ({order['title']}):\nاختر منتجاً لتعديل سعره:"
 
+        # رسالة الأزرار بنفس الكروب تتعدل بمكانها (وتحديثات ورا بعض لنفس الطلب تندمج بتعديل واحد)؛
+        # إذا كانت بكروب ثاني تنحذف وتنرسل جديدة هنا
         msg_info = last_button_message.get(order_id)
-        if msg_info:
+        edit_message_id = None
+        if msg_info and msg_info["chat_id"] == chat_id:
+            edit_message_id = msg_info["message_id"]
+        elif msg_info:
             _delete_message_in_background(context, chat_id=msg_info["chat_id"], message_id=msg_info["message_id"])
+            _unindex_message(context.application.bot_data, msg_info["chat_id"], msg_info["message_id"])
 
-        msg = await context.bot.send_message(
-            chat_id=chat_id,
-            text=message_text,
-            reply_markup=markup,
-            parse_mode="Markdown",
+        message_id = await telegram_outbox.show(
+            context.bot, chat_id, order_id, message_text,
+            reply_markup=markup, parse_mode="Markdown", message_id=edit_message_id,
         )
-        last_button_message[order_id] = {"chat_id": chat_id, "message_id": msg.message_id}
-        _save_data_in_background(context)
+        if message_id != edit_message_id:
+            if edit_message_id is not None:
+                # ما انعدلت (انحذفت أو قديمة) وانرسلت جديدة
+                _unindex_message(context.application.bot_data, chat_id, edit_message_id)
+            last_button_message[order_id] = {"chat_id": chat_id, "message_id": message_id}
+            _index_message(context.application.bot_data, chat_id, message_id, order_id)
+            _save_data_in_background(context)
 
         if "messages_to_delete" in user_data:
             for m_info in user_data["messages_to_delete"]:
                 _delete_message_in_background(context, chat_id=m_info["chat_id"], message_id=m_info["message_id"])
             user_data["messages_to_delete"].clear()
 
+    except TimedOut:
+        # الإرسال ما انعاد (telegram_outbox) وممكن الرسالة وصلت: ما نرسل رسالة خطأ فوكها
+        logger.warning(f"[{chat_id}] Buttons message for order {order_id} timed out; it may not have been delivered.")
     except Exception as e:
         logger.error(f"Error in show_buttons: {e}", exc_info=True)
         await context.bot.send_message(chat_id=chat_id, text="⚠️ حدث خطأ في عرض قائمة المنتجات.")
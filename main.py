@@ -1,39 +1,40 @@
 import os
-import re
 import json
-import uuid
 import time
 import asyncio
 import logging
 import threading
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from datetime import datetime, timedelta, timezone
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, Defaults, MessageHandler, CallbackQueryHandler, filters
 
 # استيراد الوظائف المساعدة من الملفات الموجودة
-from features.delivery_zones import get_delivery_price, get_matching_zone_name
+from db import db_connection, get_db_stats
+from events import publish_event, sse_stream
+from persistence import get_persistence_stats
+from repository import ORDER_STATUSES, get_repository_stats, order_repository
+from telegram_outbox import get_outbox_stats
+from async_db import LOOP_STATS_LOG_INTERVAL, get_loop_stats, log_loop_stats
+from archive import ARCHIVE_INTERVAL, find_archived_orders, get_archive_stats, get_archived_order, run_archive_job
+from features.delivery_zones import get_delivery_price, get_matching_zone_name, get_zone_registry_stats, reload_delivery_zones
+from features.fixed_prices import get_price_tables_stats, reload_price_tables
+from features.phone_numbers import find_phone_line
 
 # --- إعدادات أساسية ---
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# الاتصال بقاعدة البيانات (PostgreSQL)
-DATABASE_URL = os.environ.get('DATABASE_URL')
-
-def get_db_connection():
-    if DATABASE_URL:
-        return psycopg2.connect(DATABASE_URL, sslmode='require')
-    return None
-
+# الاتصال بقاعدة البيانات (PostgreSQL) عبر الـ pool المشترك في db.py
 def init_db():
-    conn = get_db_connection()
-    if conn:
+    with db_connection() as conn:
+        if not conn:
+            return
         with conn.cursor() as cur:
+            # عملية الويب وعملية البوت تبدي سوه: واحد بس يسوي الـ DDL بكل مرة (القفل ينفك بنهاية المعاملة)
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('talabat_init_db'))")
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS orders (
                     id TEXT PRIMARY KEY,
@@ -65,26 +66,204 @@ def init_db():
             except:
                 pass
 
-        conn.commit()
-        conn.close()
-        logger.info("Database initialized successfully.")
+            # تتبع التغييرات للوحة (/api/orders?since=): كل صف يحمل رقم المعاملة اللي عدّلته آخر مرة،
+            # والحذف ينسجل بجداول tombstones حتى اللوحة تشيله بدون تحميل كامل
+            cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0")
+            cur.execute("ALTER TABLE pricing ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS order_tombstones (
+                    id TEXT PRIMARY KEY,
+                    version BIGINT NOT NULL,
+                    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS pricing_tombstones (
+                    order_id TEXT,
+                    product TEXT,
+                    version BIGINT NOT NULL,
+                    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (order_id, product)
+                )
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION set_row_version() RETURNS trigger AS $$
+                BEGIN
+                    NEW.version := txid_current();
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION record_order_tombstone() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO order_tombstones (id, version) VALUES (OLD.id, txid_current())
+                    ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, deleted_at = CURRENT_TIMESTAMP;
+                    RETURN OLD;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION record_pricing_tombstone() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO pricing_tombstones (order_id, product, version) VALUES (OLD.order_id, OLD.product, txid_current())
+                    ON CONFLICT (order_id, product) DO UPDATE SET version = EXCLUDED.version, deleted_at = CURRENT_TIMESTAMP;
+                    RETURN OLD;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cur.execute("DROP TRIGGER IF EXISTS orders_set_version ON orders")
+            cur.execute("CREATE TRIGGER orders_set_version BEFORE INSERT OR UPDATE ON orders FOR EACH ROW EXECUTE PROCEDURE set_row_version()")
+            cur.execute("DROP TRIGGER IF EXISTS pricing_set_version ON pricing")
+            cur.execute("CREATE TRIGGER pricing_set_version BEFORE INSERT OR UPDATE ON pricing FOR EACH ROW EXECUTE PROCEDURE set_row_version()")
+            cur.execute("DROP TRIGGER IF EXISTS orders_tombstone ON orders")
+            cur.execute("CREATE TRIGGER orders_tombstone AFTER DELETE ON orders FOR EACH ROW EXECUTE PROCEDURE record_order_tombstone()")
+            cur.execute("DROP TRIGGER IF EXISTS pricing_tombstone ON pricing")
+            cur.execute("CREATE TRIGGER pricing_tombstone AFTER DELETE ON pricing FOR EACH ROW EXECUTE PROCEDURE record_pricing_tombstone()")
+            cur.execute("CREATE INDEX IF NOT EXISTS orders_version_idx ON orders (version)")
+            # صفحات /api/orders: keyset على (created_at, id)، ووحدة لكل فلتر (الحالة بعدين، والمجهز)
+            cur.execute("DROP INDEX IF EXISTS orders_created_at_idx")
+            cur.execute("CREATE INDEX IF NOT EXISTS orders_created_at_id_idx ON orders (created_at, id)")
+
+            # رقم الفاتورة: من تسلسل واحد وقت إنشاء الطلب ويبقى ثابت على صف الطلب
+            # (الموقع والبوت يسحبون من نفس التسلسل: DEFAULT العمود وقت الإدخال)
+            cur.execute("CREATE SEQUENCE IF NOT EXISTS invoice_seq")
+            cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS invoice_no BIGINT")
+            # الطلبات القديمة اللي بدون رقم: نرقمها من الأقدم للأحدث بعد أكبر رقم موجود
+            cur.execute("""
+                WITH numbered AS (
+                    SELECT id, row_number() OVER (ORDER BY created_at, id) AS rn
+                    FROM orders WHERE invoice_no IS NULL
+                )
+                UPDATE orders o SET invoice_no = (SELECT COALESCE(MAX(invoice_no), 0) FROM orders) + n.rn
+                FROM numbered n WHERE o.id = n.id
+            """)
+            # التسلسل يكمل بعد أكبر رقم مستعمل (بالطلبات أو بعداد invoice_counter القديم)
+            cur.execute("""
+                SELECT GREATEST(
+                    (SELECT COALESCE(MAX(invoice_no), 0) FROM orders),
+                    (SELECT COALESCE(MAX(count), 1) - 1 FROM invoice_counter),
+                    (SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM invoice_seq)
+                )
+            """)
+            last_used = cur.fetchone()[0]
+            if last_used > 0:
+                cur.execute("SELECT setval('invoice_seq', %s)", (last_used,))
+            cur.execute("ALTER TABLE orders ALTER COLUMN invoice_no SET DEFAULT nextval('invoice_seq')")
+            # صاحب الطلب بالبوت (طلبات اللوحة بدون)
+            cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS user_id TEXT")
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS orders_invoice_no_idx ON orders (invoice_no)")
+            cur.execute("CREATE INDEX IF NOT EXISTS pricing_version_idx ON pricing (version)")
+
+            # حالة الطلب (تبويبات اللوحة: جديد / قيد التجهيز / مكتمل) محفوظة على الصف ومفهرسة،
+            # بدل ما اللوحة تحسبها من كل الطلبات وكل التسعير:
+            # completed إذا places_count > 0، new إذا ولا منتج بيه سعر بيع، وإلا processing
+            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'orders' AND column_name = 'status'")
+            needs_status_backfill = cur.fetchone() is None
+            cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS priced_count INTEGER NOT NULL DEFAULT 0")
+            cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'new'")
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION order_priced_count(oid TEXT, prods TEXT[]) RETURNS INTEGER AS $$
+                    SELECT count(*)::int FROM pricing WHERE order_id = oid AND product = ANY(prods) AND sell <> 0
+                $$ LANGUAGE sql STABLE
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION set_order_status() RETURNS trigger AS $$
+                BEGIN
+                    NEW.priced_count := order_priced_count(NEW.id, NEW.products);
+                    NEW.status := CASE
+                        WHEN COALESCE(NEW.places_count, 0) > 0 THEN 'completed'
+                        WHEN NEW.priced_count = 0 THEN 'new'
+                        ELSE 'processing'
+                    END;
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            # التسعير يتغير بدفعات (upsert متعدد الصفوف): trigger لكل جملة مو لكل صف، ونلمس بس الطلب اللي تغير عدده
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION refresh_orders_priced_count() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        UPDATE orders o SET priced_count = order_priced_count(o.id, o.products)
+                        WHERE o.id IN (SELECT DISTINCT order_id FROM old_rows)
+                          AND o.priced_count <> order_priced_count(o.id, o.products);
+                    ELSE
+                        UPDATE orders o SET priced_count = order_priced_count(o.id, o.products)
+                        WHERE o.id IN (SELECT DISTINCT order_id FROM new_rows)
+                          AND o.priced_count <> order_priced_count(o.id, o.products);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cur.execute("DROP TRIGGER IF EXISTS orders_set_status ON orders")
+            cur.execute("CREATE TRIGGER orders_set_status BEFORE INSERT OR UPDATE ON orders FOR EACH ROW EXECUTE PROCEDURE set_order_status()")
+            for op, ref in (("INSERT", "NEW TABLE AS new_rows"), ("UPDATE", "NEW TABLE AS new_rows"), ("DELETE", "OLD TABLE AS old_rows")):
+                cur.execute(f"DROP TRIGGER IF EXISTS pricing_priced_count_{op.lower()} ON pricing")
+                cur.execute(f"CREATE TRIGGER pricing_priced_count_{op.lower()} AFTER {op} ON pricing "
+                            f"REFERENCING {ref} FOR EACH STATEMENT EXECUTE PROCEDURE refresh_orders_priced_count()")
+            if needs_status_backfill:
+                # الـ BEFORE trigger يحسب العدد والحالة لكل صف
+                cur.execute("UPDATE orders SET priced_count = 0")
+            cur.execute("CREATE INDEX IF NOT EXISTS orders_status_created_at_idx ON orders (status, created_at, id)")
+            cur.execute("DROP INDEX IF EXISTS orders_assigned_to_idx")
+            cur.execute("CREATE INDEX IF NOT EXISTS orders_assigned_created_at_idx ON orders (assigned_to, created_at, id)")
+            cur.execute("CREATE INDEX IF NOT EXISTS order_tombstones_version_idx ON order_tombstones (version)")
+            cur.execute("CREATE INDEX IF NOT EXISTS pricing_tombstones_version_idx ON pricing_tombstones (version)")
+
+            # أرشيف الطلبات المكتملة (archive.py): partition لكل شهر حسب created_at، الأقسام تنخلق وقت الأرشفة
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS orders_archive (
+                    id TEXT NOT NULL,
+                    user_id TEXT,
+                    title TEXT,
+                    phone_number TEXT,
+                    products TEXT[],
+                    places_count INTEGER DEFAULT 0,
+                    assigned_to TEXT,
+                    invoice_no BIGINT,
+                    created_at TIMESTAMP NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at)
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS pricing_archive (
+                    order_id TEXT NOT NULL,
+                    product TEXT NOT NULL,
+                    buy NUMERIC,
+                    sell NUMERIC,
+                    prepared_by TEXT,
+                    order_created_at TIMESTAMP NOT NULL,
+                    PRIMARY KEY (order_id, product, order_created_at)
+                ) PARTITION BY RANGE (order_created_at)
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS orders_archive_invoice_no_idx ON orders_archive (invoice_no)")
+            # أعلى version لـ tombstones انشالت: المخزن اللي مؤشره أقدم منه يسوي تحميل كامل
+            cur.execute("CREATE TABLE IF NOT EXISTS feed_horizon (version BIGINT NOT NULL)")
+            cur.execute("INSERT INTO feed_horizon (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM feed_horizon)")
+
+            # طلبات الموقع المعلّقة (pending_orders.py): تبقى بعد إعادة التشغيل لحد ما تكتمل أو تنتهي
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS pending_site_orders (
+                    id BIGSERIAL PRIMARY KEY,
+                    chat_id BIGINT NOT NULL,
+                    payload JSONB NOT NULL,
+                    created_at DOUBLE PRECISION NOT NULL
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS pending_site_orders_chat_idx ON pending_site_orders (chat_id, id)")
+
+    logger.info("Database initialized successfully.")
 
 init_db()
 
 # --- وظائف المساعدة للتحليل الذكي ---
-def _extract_phone_from_text(text):
-    raw = re.sub(r"[\s\-]", "", text)
-    m = re.search(r"(?:\+?964|0)?7\d{9}", raw)
-    if m:
-        digits = re.sub(r"\D", "", m.group(0))
-        if digits.startswith("964"): digits = digits[3:]
-        if digits.startswith("7") and len(digits) >= 10: return "0" + digits[:10]
-        if digits.startswith("0") and len(digits) >= 11: return digits[:11]
-    return "مطلوب"
-
 def parse_bulk_order(raw_text):
     lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
-    phone = _extract_phone_from_text(raw_text)
+    phone, phone_idx = find_phone_line(lines)
+    if not phone: phone = "مطلوب"
     try:
         zone = get_matching_zone_name(raw_text)
     except:
@@ -92,53 +271,15 @@ def parse_bulk_order(raw_text):
     title = zone if zone else (lines[0] if lines else "عنوان غير معروف")
 
     products = []
-    # تنظيف الرقم للمقارنة
-    clean_phone = re.sub(r"\D", "", phone) if phone != "مطلوب" else ""
-
-    for line in lines:
-        line_clean = re.sub(r"\D", "", line)
-        # إذا السطر يحتوي على الرقم، نتجاهله ولا نعتبره منتجاً
-        if clean_phone and clean_phone in line_clean and len(line_clean) >= 9: continue
+    for i, line in enumerate(lines):
+        # سطر الرقم نتجاهله ولا نعتبره منتجاً
+        if i == phone_idx: continue
         if title and title == line: continue
         if zone and zone in line: continue
         if len(line) < 2: continue
         products.append(line)
     return title, phone, products
 
-# --- وظائف إدارة البيانات (قاعدة البيانات) ---
-def fetch_all_data_db():
-    conn = get_db_connection()
-    if not conn: return {}, {}, {}
-    orders_dict = {}
-    pricing_dict = {}
-    invoice_dict = {}
-
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT * FROM orders ORDER BY created_at DESC")
-        rows = cur.fetchall()
-        for i, r in enumerate(rows):
-            oid = r['id']
-            orders_dict[oid] = {
-                "id": oid,
-                "title": r['title'],
-                "phone_number": r['phone_number'],
-                "products": r['products'],
-                "places_count": r['places_count'],
-                "assigned_to": r.get('assigned_to'),
-                "created_at": r['created_at'].isoformat()
-            }
-            invoice_dict[oid] = i + 1
-
-        cur.execute("SELECT * FROM pricing")
-        rows_p = cur.fetchall()
-        for rp in rows_p:
-            oid = rp['order_id']
-            if oid not in pricing_dict: pricing_dict[oid] = {}
-            pricing_dict[oid][rp['product']] = {"buy": float(rp['buy']), "sell": float(rp['sell']), "prepared_by": rp['prepared_by']}
-
-    conn.close()
-    return orders_dict, pricing_dict, invoice_dict
-
 # --- Flask Web Server ---
 app = Flask(__name__)
 CORS(app)
@@ -146,31 +287,118 @@ CORS(app)
 @app.route('/')
 def index(): return render_template('index.html')
 
-@app.route('/api/orders')
-def get_orders():
-    o, p, inv = fetch_all_data_db()
-    from features.product_categories import is_meat, is_fish, is_vegetable_fruit
-    from features.fixed_prices import suggest_fixed_prices
-    
+def _annotate_products(orders):
+    """تصنيف المنتجات (لحم/سمك/خضروات) والأسعار المقترحة للطلبات المعطاة فقط."""
+    from features.product_categories import classify_many
+    from features.fixed_prices import cached_price_suggestion
+
     categories = {}
     suggested_pricing = {}
-    
-    for oid, order in o.items():
+    all_categories = classify_many(prod for order in orders.values() for prod in order['products'])
+
+    for oid, order in orders.items():
         categories[oid] = {}
         suggested_pricing[oid] = {}
-        
+
         for prod in order['products']:
-             cat = "unknown"
-             if is_meat(prod): cat = "meat"
-             elif is_fish(prod): cat = "fish"
-             elif is_vegetable_fruit(prod): cat = "veg"
-             categories[oid][prod] = cat
-             
-             fixed = suggest_fixed_prices(prod)
+             categories[oid][prod] = all_categories[prod]
+
+             fixed = cached_price_suggestion(prod)
              if fixed:
                  suggested_pricing[oid][prod] = {"buy": fixed['buy_total'], "sell": fixed['sell_total']}
-             
-    return jsonify({"orders": o, "pricing": p, "invoice_numbers": inv, "categories": categories, "suggested_pricing": suggested_pricing})
+
+    return categories, suggested_pricing
+
+def _conditional_json(payload):
+    """رد JSON مع ETag قوي؛ إذا المتصفح عنده نفس النسخة يرجع 304 بدون جسم."""
+    resp = jsonify(payload)
+    resp.add_etag()
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
+
+ORDERS_PAGE_SIZE = int(os.environ.get("ORDERS_PAGE_SIZE", "50"))
+ORDERS_PAGE_MAX = int(os.environ.get("ORDERS_PAGE_MAX", "200"))
+PAGE_PARAMS = ('status', 'assigned_to', 'from', 'to', 'after', 'limit')
+
+def _parse_day_bound(value, end=False):
+    """
+    from/to: تاريخ (2026-10-17) أو وقت ISO. تاريخ بدون وقت بـ to يشمل اليوم كله (لحد بداية اليوم اللي بعده).
+    وقت بيه فرق توقيت (+03:00) يتحول لـ UTC أول، مثل created_at المخزون (CURRENT_TIMESTAMP بتوقيت السيرفر UTC).
+    """
+    if value is None:
+        return None
+    when = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        when += timedelta(days=1)
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when.isoformat()
+
+def _compact_orders(orders, pricing):
+    """
+    شكل مختصر للصفحة: قائمة بالترتيب، وكل طلب وياه تسعيره وتصنيف منتجاته وأسعاره المقترحة
+    (بدون قواميس منفصلة مفتاحها رقم الطلب، وبدون الحقول اللي اللوحة ما تستعملها).
+    """
+    categories, suggested_pricing = _annotate_products({o['id']: o for o in orders})
+    items = []
+    for o in orders:
+        oid = o['id']
+        item = {k: o.get(k) for k in ('id', 'invoice_no', 'title', 'phone_number', 'products', 'places_count',
+                                       'assigned_to', 'status', 'priced_count', 'created_at')}
+        prices = {p: {"buy": v['buy'], "sell": v['sell']} for p, v in (pricing.get(oid) or {}).items()}
+        for key, value in (('pricing', prices), ('categories', categories.get(oid)), ('suggested', suggested_pricing.get(oid))):
+            if value:
+                item[key] = value
+        items.append(item)
+    return items
+
+@app.route('/api/orders')
+def get_orders():
+    """
+    صفحة (إذا اكو أي من status/assigned_to/from/to/after/limit): الأحدث أولاً بـ keyset على (created_at, id).
+      status=<new|processing|completed>، assigned_to=<المجهز>، from/to=<تاريخ أو وقت ISO> (to ما يشمل الحد)،
+      limit=<n> (أقصى ORDERS_PAGE_MAX)، after=<next من الصفحة اللي قبلها>.
+      الرد: {"orders": [...], "next": مؤشر أو null, "counts": {الحالة: العدد بنفس الفلاتر}} (counts بالصفحة الأولى بس، بعدها null).
+    بدون since: كل الطلبات (مثل قبل) + cursor.
+    مع since=<cursor>: بس التغييرات من بعده (طلبات، تسعير، ومحذوفات) — اللوحة تدمجها بالموجود عندها.
+    """
+    if any(k in request.args for k in PAGE_PARAMS):
+        status = request.args.get('status') or None
+        if status is not None and status not in ORDER_STATUSES:
+            return jsonify({"error": f"status must be one of {', '.join(ORDER_STATUSES)}"}), 400
+        limit = min(max(request.args.get('limit', type=int) or ORDERS_PAGE_SIZE, 1), ORDERS_PAGE_MAX)
+        try:
+            created_from = _parse_day_bound(request.args.get('from'))
+            created_to = _parse_day_bound(request.args.get('to'), end=True)
+            orders, pricing, counts, next_cursor = order_repository.page(
+                status=status, assigned_to=request.args.get('assigned_to') or None,
+                created_from=created_from, created_to=created_to,
+                after=request.args.get('after') or None, limit=limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return _conditional_json({"page": True, "limit": limit, "counts": counts, "next": next_cursor,
+                                  "orders": _compact_orders(orders, pricing)})
+
+    since = request.args.get('since', type=int)
+    if since is not None:
+        changes = order_repository.changes_since(since)
+        if changes is not None:
+            categories, suggested_pricing = _annotate_products(changes['orders'])
+            payload = {"full": False, **changes, "categories": categories, "suggested_pricing": suggested_pricing}
+            return _conditional_json(payload)
+
+    o, p, inv, cursor = order_repository.snapshot()
+    categories, suggested_pricing = _annotate_products(o)
+    return _conditional_json({"full": True, "cursor": cursor, "orders": o, "pricing": p, "invoice_numbers": inv,
+                              "categories": categories, "suggested_pricing": suggested_pricing})
+
+@app.route('/api/orders/<oid>')
+def get_single_order(oid):
+    """طلب واحد بنفس شكل عناصر الصفحة (اللوحة تحتاجه إذا الطلب المفتوح طلع من الصفحة اللي عندها)."""
+    order, pricing, _ = order_repository.get_order(oid)
+    if not order:
+        return jsonify({"error": "Order not found"}), 404
+    return _conditional_json({"order": _compact_orders([order], {oid: pricing})[0]})
 
 @app.route('/api/add_order', methods=['POST'])
 def add_order():
@@ -202,51 +430,78 @@ def add_order():
     else:
         title = confirmed_zone
 
-    oid = str(uuid.uuid4())[:8]
-    conn = get_db_connection()
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute("INSERT INTO orders (id, title, phone_number, products, assigned_to) VALUES (%s, %s, %s, %s, %s)",
-                        (oid, title, phone, products, assigned_to))
-        conn.commit()
-        conn.close()
-    return jsonify({"status": "success"})
+    order = order_repository.create_order(title, phone, products, assigned_to=assigned_to)
+    return jsonify({"status": "success", "order_id": order['id'], "invoice_no": order['invoice_no']})
 
 @app.route('/api/update_price', methods=['POST'])
 def update_price():
     data = request.json
     oid, prod, buy, sell = data['order_id'], data['product'], data['buy'], data['sell']
-    conn = get_db_connection()
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO pricing (order_id, product, buy, sell, prepared_by)
-                VALUES (%s, %s, %s, %s, 'الموقع')
-                ON CONFLICT (order_id, product) DO UPDATE SET buy = %s, sell = %s
-            """, (oid, prod, buy, sell, buy, sell))
-        conn.commit()
-        conn.close()
+    if order_repository.set_prices(oid, {prod: (buy, sell)}) is None:
+        return jsonify({"status": "error", "error": "Order not found"}), 404
     return jsonify({"status": "success"})
 
+@app.route('/api/update_prices', methods=['POST'])
+def update_prices():
+    """
+    تسعير عدة منتجات لنفس الطلب بمعاملة وحدة (upsert متعدد الصفوف بدل طلب لكل منتج).
+    الجسم: {"order_id": ..., "items": [{"product", "buy", "sell"}, ...]}
+    يرجع نتيجة لكل صف: ok أو error مع السبب.
+    """
+    data = request.json or {}
+    oid = data.get('order_id')
+    items = data.get('items') or []
+    if not oid:
+        return jsonify({"status": "error", "error": "order_id is required", "results": []}), 400
+
+    results = []
+    rows = {}
+    for item in items:
+        item = item or {}
+        prod = item.get('product')
+        if not prod:
+            results.append({"product": prod, "status": "error", "error": "missing product"})
+            continue
+        try:
+            buy, sell = float(item['buy']), float(item['sell'])
+        except (KeyError, TypeError, ValueError):
+            results.append({"product": prod, "status": "error", "error": "invalid buy/sell"})
+            continue
+        # نفس المنتج مرتين بنفس الدفعة: آخر قيمة هي اللي تنحفظ
+        rows[prod] = (buy, sell)
+        results.append({"product": prod, "status": "pending"})
+
+    saved = order_repository.set_prices(oid, rows)
+    if saved is None:
+        return jsonify({"status": "error", "error": "Order not found", "results": [
+            {"product": r["product"], "status": "error", "error": "Order not found"} for r in results
+        ]}), 404
+
+    for r in results:
+        if r["status"] == "pending":
+            if r["product"] in saved:
+                r["status"] = "ok"
+            else:
+                r.update(status="error", error="not saved")
+    status = "success" if all(r["status"] == "ok" for r in results) else "partial"
+    return jsonify({"status": status, "results": results})
+
 @app.route('/api/finalize', methods=['POST'])
 def finalize():
     data = request.json
-    conn = get_db_connection()
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE orders SET places_count = %s WHERE id = %s", (data['places_count'], data['order_id']))
-        conn.commit()
-        conn.close()
+    order_repository.finalize(data['order_id'], data['places_count'])
     return jsonify({"status": "success"})
 
 @app.route('/api/get_invoice/<oid>')
 def get_invoice(oid):
-    o, p, inv = fetch_all_data_db()
-    if oid not in o:
+    order, pricing, invoice_num = order_repository.get_order(oid)
+    if not order:
+        # الطلبات المكتملة القديمة تنتقل للأرشيف (archive.py)
+        order, pricing, invoice_num = get_archived_order(oid)
+    if not order:
         return jsonify({"error": "Order not found"})
-    order = o[oid]
-    pricing = p.get(oid, {})
-    invoice_num = inv.get(oid, "??")
+    if invoice_num is None:
+        invoice_num = "??"
     
     title = order['title']
     phone = order['phone_number']
@@ -300,25 +555,96 @@ def get_invoice(oid):
     
     return jsonify({"invoice_text": text})
 
+@app.route('/api/db/stats')
+def db_stats():
+    return jsonify(get_db_stats())
+
+@app.route('/api/persistence/stats')
+def persistence_stats():
+    return jsonify(get_persistence_stats())
+
+@app.route('/api/repository/stats')
+def repository_stats():
+    return jsonify(get_repository_stats())
+
+@app.route('/api/archive/orders')
+def archived_orders():
+    """البحث بالأرشيف برقم الفاتورة: ?invoice_no=123. الفاتورة نفسها من /api/get_invoice/<id>."""
+    invoice_no = request.args.get('invoice_no', type=int)
+    if invoice_no is None:
+        return jsonify({"error": "invoice_no is required"}), 400
+    return jsonify({"orders": find_archived_orders(invoice_no)})
+
+@app.route('/api/archive/stats')
+def archive_stats():
+    return jsonify(get_archive_stats())
+
+@app.route('/api/outbox/stats')
+def outbox_stats():
+    return jsonify(get_outbox_stats())
+
+@app.route('/api/bot/loop_stats')
+def bot_loop_stats():
+    """حجب الـ event loop لكل handler بالبوت (بوضع العملية الوحدة؛ بعملية البوت المستقلة تنطبع بسجلها)."""
+    return jsonify(get_loop_stats())
+
+@app.route('/api/zones/stats')
+def zones_stats():
+    return jsonify(get_zone_registry_stats())
+
+@app.route('/api/zones/reload', methods=['POST'])
+def zones_reload():
+    reload_delivery_zones()
+    return jsonify({"status": "success", **get_zone_registry_stats()})
+
+@app.route('/api/prices/stats')
+def prices_stats():
+    return jsonify(get_price_tables_stats())
+
+@app.route('/api/prices/reload', methods=['POST'])
+def prices_reload():
+    reload_price_tables()
+    # الاقتراحات تتغير لكل الطلبات: اللوحات تسوي تحديث كامل
+    with db_connection() as conn:
+        if conn:
+            with conn.cursor() as cur:
+                publish_event(cur, "prices_reloaded")
+        else:
+            publish_event(None, "prices_reloaded")
+    return jsonify({"status": "success", **get_price_tables_stats()})
+
 @app.route('/api/reset', methods=['POST'])
 def reset_data():
-    conn = get_db_connection()
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM orders")
-        conn.commit()
-        conn.close()
+    order_repository.reset()
     return jsonify({"status": "success"})
 
+@app.route('/api/stream')
+def stream_events():
+    """بث أحداث الطلبات للوحة (SSE): order_created / order_updated / order_deleted / price_updated / order_finalized / orders_reset / orders_archived / prices_reloaded / orders_synced."""
+    return Response(stream_with_context(sse_stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 def run_flask():
+    """سيرفر التطوير مال Flask (عملية وحدة). للإنتاج: gunicorn -c gunicorn.conf.py wsgi:app"""
     port = int(os.environ.get("PORT", 8080))
     app.run(host='0.0.0.0', port=port)
 
+def run_bot():
+    """بوت التليكرام (polling) لحد ما يوصل SIGINT/SIGTERM. بالإنتاج يشتغل بعملية لوحده: python bot.py"""
+    TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not TOKEN:
+        return False
+    bot = ApplicationBuilder().token(TOKEN).build()
+    if bot.job_queue is not None and LOOP_STATS_LOG_INTERVAL > 0:
+        bot.job_queue.run_repeating(log_loop_stats, interval=LOOP_STATS_LOG_INTERVAL, first=LOOP_STATS_LOG_INTERVAL)
+    if bot.job_queue is not None and ARCHIVE_INTERVAL > 0:
+        # أرشفة الطلبات المكتملة القديمة (عملية البوت وحدة بس تسويها)
+        bot.job_queue.run_repeating(run_archive_job, interval=ARCHIVE_INTERVAL, first=60)
+    bot.run_polling()
+    return True
+
 if __name__ == "__main__":
+    # وضع التطوير: اللوحة والبوت بنفس العملية
     threading.Thread(target=run_flask, daemon=True).start()
-    TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-    if TOKEN:
-        bot = ApplicationBuilder().token(TOKEN).build()
-        bot.run_polling()
-    else:
+    if not run_bot():
         while True: time.sleep(10)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+طلبات الموقع المعلّقة (تنتظر منطقة أو رقم زبون) — طابور مستقل لكل كروب.
+
+بدل قائمة وحدة مشتركة بين كل الكروبات (رد كروب يكمل طلبية كروب ثاني و pop(0) يصير أبطأ كل ما كبرت القائمة):
+- {chat_id: deque}: أخذ/إضافة/حذف أقدم طلبية بالكروب بوقت ثابت.
+- كل طلبية لها عمر (PENDING_ORDER_TTL) وبعده تنشال، والكروب الفاضي ينشال من القاموس.
+- أقصى عدد بكل كروب (PENDING_ORDERS_PER_CHAT): إذا زاد تنشال الأقدم.
+- نسخة بجدول pending_site_orders حتى الطلبات المعلّقة تبقى بعد إعادة التشغيل (إذا أكو DATABASE_URL).
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+from db import db_connection
+
+logger = logging.getLogger(__name__)
+
+# عمر الطلبية المعلّقة بالثواني (افتراضياً يوم)
+PENDING_ORDER_TTL = float(os.environ.get("PENDING_ORDER_TTL", "86400"))
+PENDING_ORDERS_PER_CHAT = int(os.environ.get("PENDING_ORDERS_PER_CHAT", "50"))
+# كل كم ثانية نمسح الطلبات المنتهية من كل الكروبات (مو بس الكروب اللي نتعامل وياه)
+PENDING_SWEEP_INTERVAL = float(os.environ.get("PENDING_SWEEP_INTERVAL", "300"))
+# إذا تحميل الجدول فشل (قاعدة البيانات واكفة) نعيد المحاولة بعد هالمدة (ثواني) بدل كل استعمال
+PENDING_LOAD_RETRY_INTERVAL = float(os.environ.get("PENDING_LOAD_RETRY_INTERVAL", "30"))
+
+
+class PendingOrderStore:
+    """
+    الطلبية المعلّقة قاموس (order_data, needs_region, needs_phone) ينضاف له pending_id و created_at.
+    التعديل على الطلبية (مثلاً بعد ما توصل المنطقة) لازم ينحفظ بـ update() حتى ينكتب بالجدول.
+    """
+
+    def __init__(self, ttl=PENDING_ORDER_TTL, max_per_chat=PENDING_ORDERS_PER_CHAT, sweep_interval=PENDING_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.max_per_chat = max(1, max_per_chat)
+        self.sweep_interval = sweep_interval
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._retry_at = 0.0
+        self._next_local_id = -1
+        self._last_sweep = time.time()
+        self.expired = 0
+        self.evicted = 0
+
+    # --- قاعدة البيانات ---
+
+    def _load_locked(self):
+        """
+        أول استعمال: تحميل الطلبات اللي بعدها ما انتهت من pending_site_orders (الجدول ينخلق بـ init_db).
+        إذا فشل نعيد بعد PENDING_LOAD_RETRY_INTERVAL؛ اللي انضاف بالذاكرة بيناتهم يندمج ويا المحمّل بدون تكرار.
+        """
+        try:
+            with db_connection() as conn:
+                if conn:
+                    with conn.cursor() as cur:
+                        cur.execute("DELETE FROM pending_site_orders WHERE created_at < %s", (time.time() - self.ttl,))
+                        cur.execute("SELECT id, chat_id, payload, created_at FROM pending_site_orders ORDER BY id")
+                        rows = cur.fetchall()
+                else:
+                    rows = []
+        except Exception as e:
+            self._retry_at = time.monotonic() + PENDING_LOAD_RETRY_INTERVAL
+            logger.error(f"Error loading pending site orders: {e}. Retrying in {PENDING_LOAD_RETRY_INTERVAL:.0f}s.")
+            return
+        self._loaded = True
+        known = {entry.get("pending_id") for q in self._queues.values() for entry in q}
+        restored = {}
+        for pending_id, chat_id, payload, created_at in rows:
+            if pending_id in known:
+                continue
+            entry = payload if isinstance(payload, dict) else json.loads(payload)
+            entry["pending_id"] = pending_id
+            entry["created_at"] = created_at
+            restored.setdefault(chat_id, []).append(entry)
+        for chat_id, entries in restored.items():
+            # المحمّل أقدم عادةً من اللي انضاف بعد فشل التحميل: نرتب الكل حسب الوقت
+            merged = sorted(entries + list(self._queues.get(chat_id, ())), key=lambda entry: entry["created_at"])
+            self._queues[chat_id] = deque(merged[-self.max_per_chat:])
+        if restored:
+            logger.info(f"Restored {sum(len(entries) for entries in restored.values())} pending site orders.")
+
+    def _db_insert(self, chat_id, entry):
+        try:
+            with db_connection() as conn:
+                if not conn:
+                    return None
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "INSERT INTO pending_site_orders (chat_id, payload, created_at) VALUES (%s, %s, %s) RETURNING id",
+                        (chat_id, json.dumps(_payload(entry), ensure_ascii=False), entry["created_at"]),
+                    )
+                    return cur.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error saving pending site order: {e}")
+            return None
+
+    def _db_update(self, entry):
+        if entry.get("pending_id", -1) < 0:
+            return
+        try:
+            with db_connection() as conn:
+                if conn:
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            "UPDATE pending_site_orders SET payload = %s WHERE id = %s",
+                            (json.dumps(_payload(entry), ensure_ascii=False), entry["pending_id"]),
+                        )
+        except Exception as e:
+            logger.error(f"Error updating pending site order: {e}")
+
+    def _db_delete(self, ids):
+        ids = [i for i in ids if i is not None and i >= 0]
+        if not ids:
+            return
+        try:
+            with db_connection() as conn:
+                if conn:
+                    with conn.cursor() as cur:
+                        cur.execute("DELETE FROM pending_site_orders WHERE id = ANY(%s)", (ids,))
+        except Exception as e:
+            logger.error(f"Error deleting pending site orders: {e}")
+
+    # --- الذاكرة ---
+
+    def _ensure_loaded(self):
+        if not self._loaded and time.monotonic() >= self._retry_at:
+            with self._lock:
+                if not self._loaded and time.monotonic() >= self._retry_at:
+                    self._load_locked()
+
+    def _expire_queue_locked(self, chat_id, now):
+        """يشيل الطلبات المنتهية من بداية طابور الكروب (الأقدم أول). يرجع أرقامها بالجدول."""
+        q = self._queues.get(chat_id)
+        if q is None:
+            return []
+        removed = []
+        cutoff = now - self.ttl
+        while q and q[0]["created_at"] < cutoff:
+            removed.append(q.popleft().get("pending_id"))
+        if not q:
+            del self._queues[chat_id]
+        self.expired += len(removed)
+        return removed
+
+    def _sweep_locked(self, now):
+        if now - self._last_sweep < self.sweep_interval:
+            return []
+        self._last_sweep = now
+        removed = []
+        for chat_id in list(self._queues):
+            removed.extend(self._expire_queue_locked(chat_id, now))
+        return removed
+
+    def push(self, chat_id, entry):
+        """إضافة طلبية معلّقة لآخر طابور الكروب (وحفظها بالجدول)."""
+        self._ensure_loaded()
+        now = time.time()
+        entry["created_at"] = now
+        pending_id = self._db_insert(chat_id, entry)
+        with self._lock:
+            if pending_id is None:
+                pending_id = self._next_local_id
+                self._next_local_id -= 1
+            entry["pending_id"] = pending_id
+            removed = self._sweep_locked(now) + self._expire_queue_locked(chat_id, now)
+            q = self._queues.setdefault(chat_id, deque())
+            q.append(entry)
+            while len(q) > self.max_per_chat:
+                removed.append(q.popleft().get("pending_id"))
+                self.evicted += 1
+        self._db_delete(removed)
+        return entry
+
+    def peek(self, chat_id):
+        """أقدم طلبية معلّقة (ما انتهت) بهذا الكروب، أو None."""
+        self._ensure_loaded()
+        with self._lock:
+            removed = self._expire_queue_locked(chat_id, time.time())
+            q = self._queues.get(chat_id)
+            entry = q[0] if q else None
+        self._db_delete(removed)
+        return entry
+
+    def pop(self, chat_id, entry=None):
+        """
+        شيل أقدم طلبية بهذا الكروب (بعد ما تكتمل) ورجعها، أو None.
+        entry: الطلبية اللي رجعت من peek — إذا انضافت/انتهت طلبات بينهم نشيل نفسها مو اللي صارت بالأول.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            q = self._queues.get(chat_id)
+            if not q:
+                entry = None
+            elif entry is None or q[0] is entry:
+                entry = q.popleft()
+            else:
+                try:
+                    q.remove(entry)
+                except ValueError:
+                    entry = None
+            if q is not None and not q:
+                del self._queues[chat_id]
+        if entry is not None:
+            self._db_delete([entry.get("pending_id")])
+        return entry
+
+    def update(self, entry):
+        """حفظ تعديل على طلبية معلّقة (منطقة وصلت، أو صار يحتاج رقم)."""
+        self._db_update(entry)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chats": len(self._queues),
+                "pending": sum(len(q) for q in self._queues.values()),
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "ttl": self.ttl,
+                "max_per_chat": self.max_per_chat,
+            }
+
+
+def _payload(entry):
+    return {k: v for k, v in entry.items() if k not in ("pending_id", "created_at")}
+
+
+pending_site_orders = PendingOrderStore()
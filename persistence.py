@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+حفظ الطلبات المتغيّرة بالذاكرة (قواميس orders و pricing بمخزن الطلبات — repository.py) بقاعدة البيانات بطريقة write-behind.
+
+الكتابات العادية تروح write-through من repository؛ هنا بس اللي ما يقدر ينكتب فوراً:
+تعديل مباشر على القواميس من كود البوت (repository.touch) أو كتابة فشلت وقاعدة البيانات واكفة.
+- المخزن يعلّم الطلب «متغيّر» (mark_dirty) أو «محذوف» (mark_deleted) وبس.
+- thread واحد يجمع التغييرات خلال PERSIST_WINDOW ثانية ويكتب الطلبات المتغيّرة بس
+  (upsert للطلب + صفوف تسعيره) بنفس جداول orders/pricing اللي تستعملها اللوحة، بمعاملة وحدة.
+- عند الإغلاق (atexit) نكتب الباقي.
+- إحصائيات: عدد الطلبات المنتظرة، عدد مرات الكتابة، زمن الكتابة.
+بدون DATABASE_URL ما يشتغل (enabled = False) والطلبات تبقى بالذاكرة بس.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+
+from psycopg2.extras import execute_values
+
+from db import DATABASE_URL, db_connection
+from events import publish_event
+
+logger = logging.getLogger(__name__)
+
+# كم ثانية نجمع التغييرات قبل الكتابة
+PERSIST_WINDOW = float(os.environ.get("PERSIST_WINDOW", "2"))
+# أقصى انتظار بعد فشل الكتابة قبل المحاولة من جديد
+PERSIST_MAX_BACKOFF = float(os.environ.get("PERSIST_MAX_BACKOFF", "60"))
+
+
+def _copy_order(orders, pricing, order_id):
+    """نسخة من الطلب وتسعيره. البوت ممكن يعدّل بنفس اللحظة، فإذا تغيّر القاموس أثناء النسخ نعيد."""
+    while True:
+        try:
+            order = orders.get(order_id)
+            if order is None:
+                return None, None
+            order = dict(order)
+            order["products"] = list(order.get("products") or [])
+            prices = {p: dict(v) for p, v in list((pricing.get(order_id) or {}).items())}
+            return order, prices
+        except RuntimeError:
+            continue
+
+
+class WriteBehindStore:
+    def __init__(self, window=PERSIST_WINDOW, enabled=bool(DATABASE_URL)):
+        self.window = window
+        self.enabled = enabled
+        self._bot_data = None
+        self._dirty = set()
+        self._deleted = set()
+        # الطلبات اللي بنص كتابة هسه (انشالت من dirty بس بعد ما انكتبت)
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._first_dirty_at = None
+        self._thread = None
+        self._closed = False
+        self._flush_lock = threading.Lock()
+        self.flushes = 0
+        self.orders_written = 0
+        self.orders_deleted = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_total = 0.0
+
+    def _ensure_thread_locked(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="order-write-behind", daemon=True)
+            self._thread.start()
+
+    def _mark(self, bot_data, order_id, deleted):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._bot_data = bot_data
+            if deleted:
+                self._dirty.discard(order_id)
+                self._deleted.add(order_id)
+            else:
+                self._deleted.discard(order_id)
+                self._dirty.add(order_id)
+            if self._first_dirty_at is None:
+                self._first_dirty_at = time.monotonic()
+                self._wakeup.notify()
+            self._ensure_thread_locked()
+
+    def mark_dirty(self, bot_data, order_id):
+        """الطلب (أو تسعيره) تغيّر: ينكتب بالكتابة الجاية. bot_data: قاموس بيه "orders" و "pricing"."""
+        self._mark(bot_data, order_id, deleted=False)
+
+    def mark_deleted(self, bot_data, order_id):
+        self._mark(bot_data, order_id, deleted=True)
+
+    def is_pending(self, order_id):
+        """الطلب تغيّر بالذاكرة وبعده ما انكتب (أو بنص الكتابة): نسخة قاعدة البيانات أقدم منه."""
+        with self._lock:
+            return order_id in self._dirty or order_id in self._deleted or order_id in self._inflight
+
+    def _run(self):
+        backoff = self.window
+        while True:
+            with self._lock:
+                while self._first_dirty_at is None and not self._closed:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                # كل التغييرات من أول تعليم لحد نهاية النافذة تنكتب سوه
+                delay = self._first_dirty_at + self.window - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if self.flush():
+                backoff = self.window
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, PERSIST_MAX_BACKOFF)
+
+    def flush(self):
+        """كتابة كل التغييرات المنتظرة الآن. يرجع False إذا فشلت (وتبقى منتظرة للمحاولة الجاية)."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, deleted, bot_data = self._dirty, self._deleted, self._bot_data
+                self._dirty, self._deleted = set(), set()
+                self._inflight = dirty | deleted
+                self._first_dirty_at = None
+            if not dirty and not deleted:
+                return True
+            start = time.monotonic()
+            try:
+                written = self._write(bot_data, dirty, deleted)
+            except Exception as e:
+                logger.error(f"Error persisting {len(dirty)} changed / {len(deleted)} deleted orders: {e}")
+                with self._lock:
+                    self._inflight = set()
+                    self.errors += 1
+                    # اللي تعلّم بعدين أحدث — نرجع بس اللي ما تعلّم من جديد
+                    self._dirty |= {oid for oid in dirty if oid not in self._deleted}
+                    self._deleted |= {oid for oid in deleted if oid not in self._dirty}
+                    if self._first_dirty_at is None:
+                        self._first_dirty_at = time.monotonic()
+                return False
+            elapsed_ms = (time.monotonic() - start) * 1000
+            with self._lock:
+                self._inflight = set()
+                self.flushes += 1
+                self.orders_written += written
+                self.orders_deleted += len(deleted)
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self._flush_total += elapsed_ms
+            return True
+
+    def _write(self, bot_data, dirty, deleted):
+        orders = bot_data.get("orders", {}) if bot_data else {}
+        pricing = bot_data.get("pricing", {}) if bot_data else {}
+        order_rows = []
+        price_rows = []
+        for oid in dirty:
+            order, prices = _copy_order(orders, pricing, oid)
+            if order is None:
+                # انحذف من الذاكرة بدون mark_deleted — ما نكتبه
+                continue
+            order_rows.append((
+                oid, order.get("title"), order.get("phone_number"), order["products"],
+                order.get("places_count") or 0, order.get("assigned_to"), order.get("invoice_no"),
+                order.get("created_at"), order.get("user_id"),
+            ))
+            for product, p in prices.items():
+                if "buy" in p and "sell" in p:
+                    price_rows.append((oid, product, p["buy"], p["sell"], p.get("prepared_by")))
+
+        with db_connection() as conn:
+            if not conn:
+                return 0
+            with conn.cursor() as cur:
+                if deleted:
+                    cur.execute("DELETE FROM orders WHERE id = ANY(%s)", (list(deleted),))
+                if order_rows:
+                    # اللوحة تعدّل places_count والتسعير بنفسها: ما نرجّع قيمها لورا
+                    execute_values(cur, """
+                        INSERT INTO orders (id, title, phone_number, products, places_count, assigned_to, invoice_no, created_at, user_id)
+                        VALUES %s
+                        ON CONFLICT (id) DO UPDATE SET
+                            title = EXCLUDED.title,
+                            phone_number = EXCLUDED.phone_number,
+                            products = EXCLUDED.products,
+                            places_count = GREATEST(orders.places_count, EXCLUDED.places_count),
+                            assigned_to = COALESCE(EXCLUDED.assigned_to, orders.assigned_to),
+                            user_id = COALESCE(orders.user_id, EXCLUDED.user_id)
+                    """, order_rows,
+                        template="(%s, %s, %s, %s, %s, %s, COALESCE(%s, nextval('invoice_seq')), COALESCE(%s::timestamp, CURRENT_TIMESTAMP), %s)")
+                    # منتجات انشالت من الطلب: نشيل تسعيرها
+                    cur.execute("""
+                        DELETE FROM pricing p USING orders o
+                        WHERE p.order_id = o.id AND o.id = ANY(%s) AND NOT (p.product = ANY(o.products))
+                    """, ([r[0] for r in order_rows],))
+                if price_rows:
+                    execute_values(cur, """
+                        INSERT INTO pricing (order_id, product, buy, sell, prepared_by) VALUES %s
+                        ON CONFLICT (order_id, product) DO UPDATE SET
+                            buy = EXCLUDED.buy, sell = EXCLUDED.sell,
+                            prepared_by = COALESCE(EXCLUDED.prepared_by, pricing.prepared_by)
+                    """, price_rows)
+                publish_event(cur, "orders_synced", order_ids=[r[0] for r in order_rows], deleted=list(deleted))
+        return len(order_rows)
+
+    def close(self):
+        """كتابة الباقي وإيقاف الـ thread (عند إغلاق البوت)."""
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "window": self.window,
+                "queue_depth": len(self._dirty) + len(self._deleted),
+                "flushes": self.flushes,
+                "orders_written": self.orders_written,
+                "orders_deleted": self.orders_deleted,
+                "errors": self.errors,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "avg_flush_ms": round(self._flush_total / self.flushes, 3) if self.flushes else 0.0,
+                "max_flush_ms": round(self.max_flush_ms, 3),
+            }
+
+
+order_persistence = WriteBehindStore()
+atexit.register(order_persistence.close)
+
+
+def get_persistence_stats():
+    return order_persistence.stats()
@@ -0,0 +1,840 @@
+# -*- coding: utf-8 -*-
+"""
+مخزن الطلبات المشترك بين البوت واللوحة — مصدر واحد للطلبات بكل عملية.
+
+قبل: البوت يشتغل على bot_data["orders"/"pricing"] واللوحة تقرأ جداول orders/pricing مباشرة،
+فنفس الطلب يبين بشكلين لحد ما يوصل الحفظ.
+هسه: نسخة وحدة بالذاكرة (OrderRepository) والطرفين يقرون ويكتبون عن طريقها:
+- القراءة من الذاكرة: الطلبات، التسعير، أرقام الفواتير، وتغييرات /api/orders?since= (نفس المؤشر والـ tombstones).
+- الكتابة write-through: تنكتب بقاعدة البيانات بمعاملة وحدة ويا الحدث (publish_event)،
+  والصف الراجع (RETURNING) يتحدث بالذاكرة فوراً — اللي كتب يشوف التغيير بنفس اللحظة.
+- كتابات العمليات الثانية توصل بـ LISTEN: الحدث يعلّم النسخة «قديمة» وأول قراءة بعده تسحب التغييرات
+  من المؤشر بس. إذا ماكو حدث خلال REPOSITORY_MAX_STALENESS ثانية نسحب على أي حال (احتياط لحدث ضايع).
+- إذا الكتابة بقاعدة البيانات فشلت: التغيير يبقى بالذاكرة وينكتب بعدين عبر order_persistence (write-behind).
+- بدون DATABASE_URL: مخزن بالذاكرة بس مع عداد نسخ محلي.
+
+bot_data["orders"/"pricing"/"invoice_numbers"] تصير نفس قواميس المخزن (attach) حتى كود البوت القديم يبقى يشتغل؛
+التعديل المباشر عليها لازم يتبعه touch(order_id) حتى ينكتب.
+"""
+import os
+import time
+import socket
+import uuid
+import base64
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from psycopg2.extras import RealDictCursor, execute_values
+
+from archive import archived_order_ids
+from db import DATABASE_URL, db_connection
+from events import broadcaster, ensure_listener, publish_event
+from persistence import order_persistence
+
+logger = logging.getLogger(__name__)
+
+# أقصى عمر للنسخة بالذاكرة (ثواني) بدون مزامنة حتى لو ما وصل حدث
+REPOSITORY_MAX_STALENESS = float(os.environ.get("REPOSITORY_MAX_STALENESS", "30"))
+# بعد فشل المزامنة ننتظر هالمدة قبل المحاولة الجاية (حتى كل قراءة ما تنتظر قاعدة بيانات واكفة)
+REPOSITORY_RETRY_INTERVAL = float(os.environ.get("REPOSITORY_RETRY_INTERVAL", "5"))
+# المحذوفات (tombstones) بالذاكرة تبقى هالمدة (ثواني) لـ ?since=؛ مؤشر أقدم منها ياخذ تحميل كامل
+REPOSITORY_TOMBSTONE_RETENTION = float(os.environ.get("REPOSITORY_TOMBSTONE_RETENTION", "3600"))
+
+
+# الأحداث اللي ينشرها المخزن لكتاباته تنعلّم بالعملية: كتابتنا طبقناها من RETURNING، فحدثها ما يحتاج مزامنة
+_HOST = socket.gethostname()
+
+
+def _event_origin():
+    # بالـ pid وقت النشر مو وقت الاستيراد: gunicorn يستورد بالـ master (preload_app) وبعدين يسوي fork
+    return f"{_HOST}:{os.getpid()}"
+
+
+def new_order_id():
+    return str(uuid.uuid4())[:8]
+
+
+def _order_row_to_dict(r):
+    return {
+        "id": r['id'],
+        "user_id": r.get('user_id'),
+        "title": r['title'],
+        "phone_number": r['phone_number'],
+        "products": r['products'],
+        "places_count": r['places_count'],
+        "assigned_to": r.get('assigned_to'),
+        "invoice_no": r.get('invoice_no'),
+        "status": r.get('status'),
+        "priced_count": r.get('priced_count'),
+        "created_at": r['created_at'].isoformat()
+    }
+
+
+def _pricing_row_to_dict(rp):
+    return {"buy": float(rp['buy']), "sell": float(rp['sell']), "prepared_by": rp['prepared_by']}
+
+
+ORDER_STATUSES = ("new", "processing", "completed")
+
+
+def order_status(order, prices):
+    """
+    حالة الطلب (نفس تبويبات اللوحة ونفس trigger set_order_status بقاعدة البيانات) وعدد منتجاته المسعّرة:
+    completed إذا places_count > 0، new إذا ولا منتج بيه سعر بيع، وإلا processing.
+    """
+    products = set(order.get("products") or [])
+    priced = sum(1 for p, v in prices.items() if p in products and v.get("sell"))
+    if (order.get("places_count") or 0) > 0:
+        return "completed", priced
+    return ("new" if priced == 0 else "processing"), priced
+
+
+def encode_page_cursor(order):
+    """مؤشر الصفحة الجاية بعد هالطلب (created_at و id) — نص واحد ينرسل بالـ URL كما هو."""
+    raw = f"{order['created_at']}|{order['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_page_cursor(token):
+    """(created_at, id) من مؤشر encode_page_cursor. ValueError إذا المؤشر مو صالح."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_at, oid = raw.rsplit("|", 1)
+        datetime.fromisoformat(created_at)
+    except ValueError as e:
+        raise ValueError(f"invalid page cursor: {token!r}") from e
+    return created_at, oid
+
+
+def _where_sql(conditions):
+    return ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+
+def _fetch_cursor(cur):
+    """
+    مؤشر التغييرات: أقدم معاملة لسه شغالة. كل صف رقمه (version) أصغر من المؤشر صار ثابت ومرئي،
+    فالطلب الجاي يسأل عن version >= المؤشر وما يفوته شي حتى لو معاملتين خلصن بغير ترتيبهن.
+    """
+    cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) AS cursor")
+    return int(cur.fetchone()['cursor'])
+
+
+class OrderRepository:
+    """
+    نسخة الطلبات بالذاكرة. كل صف يحمل version (رقم المعاملة من قاعدة البيانات، أو عداد محلي)
+    والمحذوفات تنحفظ بـ tombstones بنفس الـ version، فالتغييرات من أي مؤشر تنحسب من الذاكرة.
+    """
+
+    def __init__(self, enabled=bool(DATABASE_URL), max_staleness=REPOSITORY_MAX_STALENESS):
+        self.enabled = enabled
+        self.max_staleness = max_staleness
+        self.orders = {}
+        self.pricing = {}
+        self.invoice_numbers = {}
+        self._order_versions = {}
+        self._pricing_versions = {}   # {order_id: {product: version}}
+        self._deleted_orders = {}     # {order_id: version}
+        self._deleted_pricing = {}    # {order_id: {product: version}}
+        # قاموس بشكل bot_data للـ write-behind (نفس القواميس)
+        self._store = {"orders": self.orders, "pricing": self.pricing}
+        # قاعدة البيانات: كل تغيير version >= cursor ما وصلنا بعد. أقدم مؤشر نكدر نحسب منه = horizon
+        self.cursor = None
+        self.horizon = None
+        self._seq = 0
+        # (وقت، cursor) كل دقيقة تقريباً: الـ horizon يتقدم لمؤشر عمره REPOSITORY_TOMBSTONE_RETENTION
+        self._cursor_marks = deque()
+        self._delete_hooks = []
+        self._lock = threading.RLock()
+        # مزامنة وحدة بالمرة، والاستعلام برا self._lock حتى القراءة ما تنتظر قاعدة البيانات
+        self._sync_lock = threading.Lock()
+        self._loaded = not enabled
+        self._stale = True
+        self._synced_at = 0.0
+        self._retry_at = 0.0
+        self.full_loads = 0
+        self.syncs = 0
+        self.sync_errors = 0
+        self.write_errors = 0
+        self.last_sync_ms = 0.0
+        if not enabled:
+            self.cursor = self.horizon = 1
+        broadcaster.add_hook(self._on_event)
+
+    # --- المزامنة من قاعدة البيانات ---
+
+    def _on_event(self, event):
+        # أي حدث (حتى resync بعد إعادة اتصال المستمع) = ممكن أكو تغيير ما عدنا، إلا كتاباتنا (طبقناها من RETURNING)
+        if event.get("origin") == _event_origin():
+            return
+        self._stale = True
+
+    def _needs_refresh_locked(self, now):
+        if now < self._retry_at:
+            return False
+        return not (self._loaded and not self._stale and now - self._synced_at < self.max_staleness)
+
+    def _refresh(self, force=False):
+        """
+        مزامنة إذا النسخة قديمة. الاستعلام يصير بدون self._lock والقفل ينمسك بس لتطبيق الصفوف؛
+        إذا مزامنة ثانية شغالة نرجع بالنسخة الحالية (قبل أول تحميل ننتظرها لأن ماكو نسخة).
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if not force and not self._needs_refresh_locked(time.monotonic()):
+                return
+        if not self._sync_lock.acquire(blocking=force or not self._loaded):
+            return
+        try:
+            with self._lock:
+                now = time.monotonic()
+                # يمكن مزامنة خلصت واحنا ننتظر القفل
+                if not force and not self._needs_refresh_locked(now):
+                    return
+                # الحدث اللي يوصل أثناء الاستعلام يرجع يعلّمها
+                self._stale = False
+                loaded, since = self._loaded, self.cursor
+            start = time.perf_counter()
+            try:
+                changes = self._fetch_changes(since) if loaded else None
+                full = self._fetch_all() if changes is None else None
+            except Exception as e:
+                with self._lock:
+                    self.sync_errors += 1
+                    self._stale = True
+                    self._retry_at = now + REPOSITORY_RETRY_INTERVAL
+                logger.error(f"Error syncing order repository: {e}")
+                return
+            with self._lock:
+                if self._loaded != loaded or self.cursor != since:
+                    # النسخة تغيرت من وكت ما بدينا: النتيجة قديمة، المزامنة الجاية تجيب الصح
+                    self._stale = True
+                    return
+                if full is not None:
+                    self._apply_load_locked(*full)
+                else:
+                    self._apply_changes_locked(*changes)
+                self._synced_at = now
+                self.last_sync_ms = (time.perf_counter() - start) * 1000
+                self._prune_tombstones_locked(now)
+        finally:
+            self._sync_lock.release()
+
+    def _prune_tombstones_locked(self, now):
+        """
+        المحذوفات بالذاكرة تكبر ويا كل طلب ينحذف أو يتأرشف؛ اللي أقدم من REPOSITORY_TOMBSTONE_RETENTION تنشال
+        والـ horizon يتقدم (/api/orders?since= بمؤشر أقدم يرجع تحميل كامل).
+        """
+        if not self._cursor_marks or now - self._cursor_marks[-1][0] >= 60:
+            self._cursor_marks.append((now, self.cursor))
+        horizon = None
+        while self._cursor_marks and now - self._cursor_marks[0][0] >= REPOSITORY_TOMBSTONE_RETENTION:
+            horizon = self._cursor_marks.popleft()[1]
+        if horizon is None or horizon <= self.horizon:
+            return
+        self._deleted_orders = {oid: v for oid, v in self._deleted_orders.items() if v >= horizon}
+        deleted_pricing = {}
+        for oid, products in self._deleted_pricing.items():
+            kept = {p: v for p, v in products.items() if v >= horizon}
+            if kept:
+                deleted_pricing[oid] = kept
+        self._deleted_pricing = deleted_pricing
+        self.horizon = horizon
+
+    def _fetch_all(self):
+        """التحميل الكامل (أول مرة، أو مؤشرنا أقدم من feed_horizon) + تشغيل مستمع الأحداث. بدون قفل."""
+        ensure_listener()
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cursor = _fetch_cursor(cur)
+                cur.execute("SELECT * FROM orders")
+                order_rows = cur.fetchall()
+                cur.execute("SELECT * FROM pricing")
+                price_rows = cur.fetchall()
+        return cursor, order_rows, price_rows
+
+    def _apply_load_locked(self, cursor, order_rows, price_rows):
+        for r in order_rows:
+            self._apply_order_locked(r)
+        for rp in price_rows:
+            self._apply_price_locked(rp)
+        if self._loaded:
+            # إعادة تحميل (tombstones المؤشر انشالت): اللي بالذاكرة وما موجود بقاعدة البيانات انحذف أو تأرشف.
+            # بس اللي version مالته أقدم من المؤشر (كان لازم يبين بالاستعلام): الأحدث يمكن كتابة طبقناها بعد الاستعلام
+            live_orders = {r['id'] for r in order_rows}
+            live_prices = {(rp['order_id'], rp['product']) for rp in price_rows}
+            for oid in list(self.orders):
+                if oid not in live_orders:
+                    if self._order_versions.get(oid, -1) < cursor:
+                        self._apply_order_delete_locked(oid, cursor)
+                    continue
+                versions = self._pricing_versions.get(oid) or {}
+                for product in list(self.pricing.get(oid) or {}):
+                    if (oid, product) not in live_prices and versions.get(product, -1) < cursor:
+                        self._apply_price_delete_locked(oid, product, cursor)
+        self.cursor = self.horizon = cursor
+        self._cursor_marks.clear()
+        self._loaded = True
+        self.full_loads += 1
+        logger.info(f"Order repository loaded {len(order_rows)} orders.")
+
+    def _fetch_changes(self, since):
+        """
+        بس اللي تغيّر من since: الطلبات، صفوف التسعير، والمحذوفات. بدون قفل.
+        None إذا since أقدم من feed_horizon (الأرشفة نظفت tombstones ممكن فاتتنا) — لازم تحميل كامل.
+        """
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT max(version) AS version FROM feed_horizon")
+                horizon = cur.fetchone()['version']
+                if horizon is not None and since < horizon:
+                    logger.info(f"Order repository cursor {since} is older than the feed horizon {horizon}; reloading.")
+                    return None
+                cursor = _fetch_cursor(cur)
+                cur.execute("SELECT * FROM orders WHERE version >= %s", (since,))
+                order_rows = cur.fetchall()
+                cur.execute("SELECT * FROM pricing WHERE version >= %s", (since,))
+                price_rows = cur.fetchall()
+                cur.execute("SELECT id, version FROM order_tombstones WHERE version >= %s", (since,))
+                deleted_orders = cur.fetchall()
+                cur.execute("SELECT order_id, product, version FROM pricing_tombstones WHERE version >= %s", (since,))
+                deleted_pricing = cur.fetchall()
+        return cursor, order_rows, price_rows, deleted_orders, deleted_pricing
+
+    def _apply_changes_locked(self, cursor, order_rows, price_rows, deleted_orders, deleted_pricing):
+        # الصف الأقدم من اللي بالذاكرة (كتابة انطبقت بعد الاستعلام) ينرفض بفحص الـ version
+        for r in deleted_orders:
+            self._apply_order_delete_locked(r['id'], r['version'])
+        for r in deleted_pricing:
+            self._apply_price_delete_locked(r['order_id'], r['product'], r['version'])
+        for r in order_rows:
+            self._apply_order_locked(r)
+        for rp in price_rows:
+            self._apply_price_locked(rp)
+        self.cursor = cursor
+        self.syncs += 1
+
+    # --- تطبيق الصفوف على الذاكرة (الأحدث version يفوز) ---
+
+    def _apply_order_locked(self, r):
+        oid, version = r['id'], r['version']
+        if version < self._order_versions.get(oid, -1) or version <= self._deleted_orders.get(oid, -1):
+            return
+        if order_persistence.is_pending(oid):
+            # بالذاكرة أحدث من قاعدة البيانات لحد ما ينكتب
+            return
+        self.orders[oid] = _order_row_to_dict(r)
+        self.pricing.setdefault(oid, {})
+        self.invoice_numbers[oid] = r['invoice_no']
+        self._order_versions[oid] = version
+        self._deleted_orders.pop(oid, None)
+
+    def _apply_price_locked(self, rp):
+        oid, product, version = rp['order_id'], rp['product'], rp['version']
+        versions = self._pricing_versions.setdefault(oid, {})
+        if version < versions.get(product, -1) or version <= self._deleted_pricing.get(oid, {}).get(product, -1):
+            return
+        if order_persistence.is_pending(oid):
+            return
+        self.pricing.setdefault(oid, {})[product] = _pricing_row_to_dict(rp)
+        versions[product] = version
+
+    def add_delete_hook(self, fn):
+        """
+        fn(order_id) بعد ما طلب ينشال من الذاكرة (حذف، تصفير، أرشفة، أو مزامنة حذف من عملية ثانية).
+        ينادى وقفل المخزن ماسوك ومن أي thread: لازم يكون سريع وما يرجع للمخزن.
+        """
+        with self._lock:
+            self._delete_hooks.append(fn)
+
+    def _apply_order_delete_locked(self, oid, version, local=False):
+        if version < self._order_versions.get(oid, -1) or (not local and order_persistence.is_pending(oid)):
+            return
+        removed = self.orders.pop(oid, None) is not None
+        self.pricing.pop(oid, None)
+        self.invoice_numbers.pop(oid, None)
+        self._order_versions.pop(oid, None)
+        self._pricing_versions.pop(oid, None)
+        self._deleted_pricing.pop(oid, None)
+        self._deleted_orders[oid] = version
+        if removed:
+            for fn in self._delete_hooks:
+                try:
+                    fn(oid)
+                except Exception as e:
+                    logger.error(f"Error in order delete hook: {e}")
+
+    def _apply_price_delete_locked(self, oid, product, version, local=False):
+        if version < self._pricing_versions.get(oid, {}).get(product, -1) or (not local and order_persistence.is_pending(oid)):
+            return
+        prices = self.pricing.get(oid)
+        if prices is not None:
+            prices.pop(product, None)
+        self._pricing_versions.get(oid, {}).pop(product, None)
+        self._deleted_pricing.setdefault(oid, {})[product] = version
+
+    def _local_version_locked(self):
+        """version لتغيير ما اجه من قاعدة البيانات (بدون DATABASE_URL، أو كتابة فشلت وتنتظر الـ write-behind)."""
+        if self.enabled:
+            # أي لوحة مؤشرها <= مؤشرنا فتشوفه بالتغييرات الجاية
+            return self.cursor or 0
+        self._seq += 1
+        self.cursor = self._seq + 1
+        return self._seq
+
+    # --- القراءة ---
+
+    def get_order(self, order_id):
+        """(order, pricing, invoice_no) نسخ من الذاكرة، أو (None, {}, None) إذا الطلب مو موجود."""
+        self._refresh()
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return None, {}, None
+            pricing = {p: dict(v) for p, v in list((self.pricing.get(order_id) or {}).items())}
+            return dict(order), pricing, self.invoice_numbers.get(order_id)
+
+    def order_ids(self):
+        """أرقام الطلبات اللي بالذاكرة، أو None إذا بعدها ما انحملت من قاعدة البيانات."""
+        self._refresh()
+        with self._lock:
+            return set(self.orders) if self._loaded else None
+
+    def snapshot(self):
+        """كل الطلبات والتسعير وأرقام الفواتير + المؤشر (للتحميل الكامل للوحة)."""
+        self._refresh()
+        with self._lock:
+            orders = {oid: dict(o) for oid, o in list(self.orders.items())}
+            pricing = {oid: {p: dict(v) for p, v in list(prices.items())} for oid, prices in list(self.pricing.items())}
+            return orders, pricing, dict(self.invoice_numbers), self.cursor
+
+    def changes_since(self, since):
+        """
+        التغييرات من المؤشر since (نفس شكل رد /api/orders?since=)،
+        أو None إذا المؤشر أقدم من اللي بالذاكرة (لازم تحميل كامل).
+        """
+        if self.enabled and self.cursor is not None and since > self.cursor:
+            # المؤشر من عملية ثانية سبقتنا بالمزامنة
+            self._stale = True
+        self._refresh()
+        with self._lock:
+            if not self._loaded or self.horizon is None or since < self.horizon:
+                return None
+            orders = {oid: dict(self.orders[oid]) for oid, v in list(self._order_versions.items())
+                      if v >= since and oid in self.orders}
+            pricing = {}
+            for oid, versions in list(self._pricing_versions.items()):
+                prices = self.pricing.get(oid) or {}
+                for product, v in list(versions.items()):
+                    if v >= since and product in prices:
+                        pricing.setdefault(oid, {})[product] = dict(prices[product])
+            deleted_orders = [oid for oid, v in list(self._deleted_orders.items()) if v >= since]
+            deleted_pricing = [[oid, product] for oid, versions in list(self._deleted_pricing.items())
+                               for product, v in list(versions.items()) if v >= since]
+            cursor = self.cursor
+        changed = bool(orders or pricing or deleted_orders or deleted_pricing)
+        return {
+            "orders": orders,
+            "pricing": pricing,
+            "deleted_orders": deleted_orders,
+            "deleted_pricing": deleted_pricing,
+            "invoice_numbers": {oid: o['invoice_no'] for oid, o in orders.items()},
+            # إذا ماكو تغيير نخلي المؤشر مثل ما هو، حتى الرد يبقى نفسه ويطلع 304
+            "cursor": cursor if changed else since,
+        }
+
+    def page(self, status=None, assigned_to=None, created_from=None, created_to=None, after=None, limit=50):
+        """
+        صفحة وحدة من الطلبات (الأحدث أولاً، keyset على (created_at, id)) مع فلاتر الحالة والمجهز وفترة الإنشاء
+        (created_from <= created_at < created_to، نصوص ISO). after: مؤشر next من الصفحة اللي قبلها.
+        يرجع (orders, pricing, counts, next): orders قائمة بالترتيب، counts لكل حالة بنفس الفلاتر (عدا الحالة)
+        بالصفحة الأولى بس (بالصفحات بعدها None — نفس العدد، اللوحة تحتفظ باللي عندها)، next مؤشر الصفحة الجاية أو None. مع قاعدة البيانات من الفهارس مباشرة (بدون تحميل كل الطلبات)، وبدونها من الذاكرة.
+        """
+        after = decode_page_cursor(after) if after else None
+        if self.enabled:
+            where, params = [], []
+            if assigned_to is not None:
+                where.append("assigned_to = %s")
+                params.append(assigned_to)
+            if created_from is not None:
+                where.append("created_at >= %s::timestamp")
+                params.append(created_from)
+            if created_to is not None:
+                where.append("created_at < %s::timestamp")
+                params.append(created_to)
+            page_where, page_params = list(where), list(params)
+            if status:
+                page_where.append("status = %s")
+                page_params.append(status)
+            if after:
+                page_where.append("(created_at, id) < (%s::timestamp, %s)")
+                page_params.extend(after)
+            with db_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    # limit + 1: نعرف إذا اكو صفحة بعدها بدون count
+                    cur.execute(f"""
+                        SELECT * FROM orders {_where_sql(page_where)}
+                        ORDER BY created_at DESC, id DESC LIMIT %s
+                    """, page_params + [limit + 1])
+                    rows = cur.fetchall()
+                    cur.execute("SELECT * FROM pricing WHERE order_id = ANY(%s)", ([r['id'] for r in rows[:limit]],))
+                    price_rows = cur.fetchall()
+                    counts = None
+                    if after is None:
+                        cur.execute(f"SELECT status, count(*) AS n FROM orders {_where_sql(where)} GROUP BY status", params)
+                        counts = {r['status']: r['n'] for r in cur.fetchall()}
+            orders = [_order_row_to_dict(r) for r in rows]
+            pricing = {o["id"]: {} for o in orders[:limit]}
+            for rp in price_rows:
+                pricing[rp['order_id']][rp['product']] = _pricing_row_to_dict(rp)
+        else:
+            def matches(o):
+                return ((assigned_to is None or o.get("assigned_to") == assigned_to)
+                        and (created_from is None or o["created_at"] >= created_from)
+                        and (created_to is None or o["created_at"] < created_to))
+
+            with self._lock:
+                matching = [o for o in list(self.orders.values()) if matches(o)]
+                counts = None
+                if after is None:
+                    counts = {}
+                    for o in matching:
+                        counts[o.get("status")] = counts.get(o.get("status"), 0) + 1
+                matching = [o for o in matching
+                            if (not status or o.get("status") == status)
+                            and (after is None or (o["created_at"], o["id"]) < after)]
+                matching.sort(key=lambda o: (o["created_at"], o["id"]), reverse=True)
+                orders = [dict(o) for o in matching[:limit + 1]]
+                pricing = {o["id"]: {p: dict(v) for p, v in (self.pricing.get(o["id"]) or {}).items()}
+                           for o in orders[:limit]}
+        next_cursor = encode_page_cursor(orders[limit - 1]) if len(orders) > limit else None
+        if counts is not None:
+            counts = {st: counts.get(st, 0) for st in ORDER_STATUSES}
+        return orders[:limit], pricing, counts, next_cursor
+
+    # --- الكتابة (write-through) ---
+
+    def _write_through(self, order_id):
+        """
+        نكتب بقاعدة البيانات هسه؟ إذا الطلب بعده ينتظر الـ write-behind (كتابة سابقة فشلت أو تعديل مباشر)
+        التغيير الجديد يلحكه بنفس الطابور، حتى ما ينكتب قبل اللي قبله.
+        """
+        return self.enabled and not order_persistence.is_pending(order_id)
+
+    def _write_failed(self, what, order_id, error):
+        self.write_errors += 1
+        logger.error(f"Error writing {what} for order {order_id}, queued for retry: {error}")
+
+    def _restatus_locked(self, order_id):
+        """الحالة بالذاكرة بعد تغيير محلي (قاعدة البيانات تحسبها بنفسها للتغييرات اللي تنكتب فوراً)."""
+        order = self.orders.get(order_id)
+        if order is None:
+            return
+        status, priced = order_status(order, self.pricing.get(order_id) or {})
+        if order.get("status") != status or order.get("priced_count") != priced:
+            self.orders[order_id] = dict(order, status=status, priced_count=priced)
+
+    def _queue_locked(self, order_id, deleted=False):
+        if deleted:
+            order_persistence.mark_deleted(self._store, order_id)
+        else:
+            order_persistence.mark_dirty(self._store, order_id)
+
+    def create_order(self, title, phone_number, products, user_id=None, assigned_to=None, invoice_no=None):
+        """
+        طلب جديد. invoice_no=None: الرقم من invoice_seq وقت الإدخال (أو بعدين إذا قاعدة البيانات واكفة).
+        يرجع نسخة الطلب (بيها id و invoice_no).
+        """
+        self._refresh()
+        oid = new_order_id()
+        products = list(products)
+        row = None
+        if self.enabled:
+            try:
+                with db_connection() as conn:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute("""
+                            INSERT INTO orders (id, title, phone_number, products, assigned_to, user_id, invoice_no)
+                            VALUES (%s, %s, %s, %s, %s, %s, COALESCE(%s, nextval('invoice_seq')))
+                            RETURNING *
+                        """, (oid, title, phone_number, products, assigned_to, user_id, invoice_no))
+                        row = cur.fetchone()
+                        publish_event(cur, "order_created", oid, origin=_event_origin())
+            except Exception as e:
+                self._write_failed("new order", oid, e)
+        with self._lock:
+            if row is not None:
+                self._apply_order_locked(row)
+            else:
+                self.orders[oid] = {
+                    "id": oid,
+                    "user_id": user_id,
+                    "title": title,
+                    "phone_number": phone_number,
+                    "products": products,
+                    "places_count": 0,
+                    "assigned_to": assigned_to,
+                    "invoice_no": invoice_no,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                }
+                self.pricing[oid] = {}
+                self.invoice_numbers[oid] = invoice_no
+                self._order_versions[oid] = self._local_version_locked()
+                self._deleted_orders.pop(oid, None)
+                self._restatus_locked(oid)
+                self._queue_locked(oid)
+            order = dict(self.orders[oid])
+        if row is None and not self.enabled:
+            publish_event(None, "order_created", oid)
+        return order
+
+    def update_order(self, order_id, title, phone_number, products):
+        """
+        تعديل عنوان/رقم/منتجات طلب موجود؛ تسعير المنتجات اللي انشالت ينحذف.
+        يرجع المنتجات اللي انشال تسعيرها، أو None إذا الطلب مو موجود.
+        """
+        self._refresh()
+        products = list(products)
+        row = None
+        removed_rows = []
+        if self._write_through(order_id):
+            try:
+                with db_connection() as conn:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        # حذف تسعير المنتجات المشالة قبل تعديل الطلب، حتى حالته (trigger) تنحسب على التسعير الباقي
+                        cur.execute("""
+                            DELETE FROM pricing WHERE order_id = %s AND NOT (product = ANY(%s))
+                            RETURNING product, txid_current() AS version
+                        """, (order_id, products))
+                        removed_rows = cur.fetchall()
+                        cur.execute("""
+                            UPDATE orders SET title = %s, phone_number = %s, products = %s
+                            WHERE id = %s RETURNING *
+                        """, (title, phone_number, products, order_id))
+                        row = cur.fetchone()
+                        if row is None:
+                            return None
+                        publish_event(cur, "order_updated", order_id, origin=_event_origin())
+            except Exception as e:
+                self._write_failed("order update", order_id, e)
+        with self._lock:
+            if row is not None:
+                self._apply_order_locked(row)
+                for r in removed_rows:
+                    self._apply_price_delete_locked(order_id, r['product'], r['version'])
+                return [r['product'] for r in removed_rows]
+            order = self.orders.get(order_id)
+            if order is None:
+                return None
+            order = dict(order, title=title, phone_number=phone_number, products=products)
+            self.orders[order_id] = order
+            version = self._local_version_locked()
+            self._order_versions[order_id] = version
+            removed = [p for p in list(self.pricing.get(order_id) or {}) if p not in products]
+            for p in removed:
+                self._apply_price_delete_locked(order_id, p, version, local=True)
+            self._restatus_locked(order_id)
+            self._queue_locked(order_id)
+        if not self.enabled:
+            publish_event(None, "order_updated", order_id)
+        return removed
+
+    def set_prices(self, order_id, prices, prepared_by='الموقع'):
+        """
+        تسعير منتجات طلب: prices = {product: (buy, sell)} بمعاملة وحدة (upsert متعدد الصفوف).
+        prepared_by ينكتب بس للصف الجديد. يرجع المنتجات اللي انحفظت، أو None إذا الطلب مو موجود.
+        """
+        self._refresh()
+        rows = order_row = None
+        if self._write_through(order_id):
+            try:
+                with db_connection() as conn:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute("SELECT 1 FROM orders WHERE id = %s", (order_id,))
+                        if not cur.fetchone():
+                            return None
+                        rows = []
+                        if prices:
+                            rows = execute_values(cur, """
+                                INSERT INTO pricing (order_id, product, buy, sell, prepared_by) VALUES %s
+                                ON CONFLICT (order_id, product) DO UPDATE SET buy = EXCLUDED.buy, sell = EXCLUDED.sell
+                                RETURNING *
+                            """, [(order_id, p, buy, sell, prepared_by) for p, (buy, sell) in prices.items()], fetch=True)
+                            # الصف بعد trigger الحالة (عدد المسعّر تغير)
+                            cur.execute("SELECT * FROM orders WHERE id = %s", (order_id,))
+                            order_row = cur.fetchone()
+                            publish_event(cur, "price_updated", order_id, products=sorted(r['product'] for r in rows), origin=_event_origin())
+            except Exception as e:
+                rows = None
+                self._write_failed("prices", order_id, e)
+        with self._lock:
+            if rows is not None:
+                for rp in rows:
+                    self._apply_price_locked(rp)
+                if order_row is not None:
+                    self._apply_order_locked(order_row)
+                return {rp['product'] for rp in rows}
+            if order_id not in self.orders:
+                return None
+            version = self._local_version_locked()
+            current = self.pricing.setdefault(order_id, {})
+            versions = self._pricing_versions.setdefault(order_id, {})
+            for p, (buy, sell) in prices.items():
+                old = current.get(p) or {}
+                current[p] = {"buy": float(buy), "sell": float(sell), "prepared_by": old.get("prepared_by") or prepared_by}
+                versions[p] = version
+                self._deleted_pricing.get(order_id, {}).pop(p, None)
+            self._restatus_locked(order_id)
+            self._queue_locked(order_id)
+        if not self.enabled:
+            publish_event(None, "price_updated", order_id, products=sorted(prices))
+        return set(prices)
+
+    def finalize(self, order_id, places_count):
+        """عدد المحلات (التجهيز). يرجع False إذا الطلب مو موجود."""
+        self._refresh()
+        row = None
+        if self._write_through(order_id):
+            try:
+                with db_connection() as conn:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute("UPDATE orders SET places_count = %s WHERE id = %s RETURNING *", (places_count, order_id))
+                        row = cur.fetchone()
+                        if row is None:
+                            return False
+                        publish_event(cur, "order_finalized", order_id, origin=_event_origin())
+            except Exception as e:
+                self._write_failed("places count", order_id, e)
+        with self._lock:
+            if row is not None:
+                self._apply_order_locked(row)
+                return True
+            order = self.orders.get(order_id)
+            if order is None:
+                return False
+            self.orders[order_id] = dict(order, places_count=places_count)
+            self._order_versions[order_id] = self._local_version_locked()
+            self._restatus_locked(order_id)
+            self._queue_locked(order_id)
+        if not self.enabled:
+            publish_event(None, "order_finalized", order_id)
+        return True
+
+    def delete_order(self, order_id):
+        self._refresh()
+        rows = None
+        if self._write_through(order_id):
+            try:
+                with db_connection() as conn:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute("DELETE FROM orders WHERE id = %s RETURNING id, txid_current() AS version", (order_id,))
+                        rows = cur.fetchall()
+                        publish_event(cur, "order_deleted", order_id, origin=_event_origin())
+            except Exception as e:
+                self._write_failed("delete", order_id, e)
+        with self._lock:
+            if rows is not None:
+                for r in rows:
+                    self._apply_order_delete_locked(r['id'], r['version'])
+                return
+            self._order_versions.pop(order_id, None)
+            self._apply_order_delete_locked(order_id, self._local_version_locked(), local=True)
+            self._queue_locked(order_id, deleted=True)
+        if not self.enabled:
+            publish_event(None, "order_deleted", order_id)
+
+    def reset(self):
+        """حذف كل الطلبات (بأمر من اللوحة). الخطأ بقاعدة البيانات يطلع للمستدعي."""
+        self._refresh()
+        if self.enabled:
+            with db_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("DELETE FROM orders RETURNING id, txid_current() AS version")
+                    rows = cur.fetchall()
+                    publish_event(cur, "orders_reset", origin=_event_origin())
+            with self._lock:
+                for r in rows:
+                    self._apply_order_delete_locked(r['id'], r['version'])
+            return
+        with self._lock:
+            version = self._local_version_locked()
+            for oid in list(self.orders):
+                self._apply_order_delete_locked(oid, version, local=True)
+        publish_event(None, "orders_reset")
+
+    def touch(self, order_id):
+        """الطلب أو تسعيره تعدّل مباشرة بالقواميس (كود البوت القديم): نعلّمه تغيّر وينكتب write-behind."""
+        with self._lock:
+            if order_id not in self.orders:
+                return
+            version = self._local_version_locked()
+            self._order_versions[order_id] = version
+            versions = self._pricing_versions.setdefault(order_id, {})
+            for p in list(self.pricing.get(order_id) or {}):
+                versions[p] = version
+            self._restatus_locked(order_id)
+            self._queue_locked(order_id)
+
+    def attach(self, bot_data):
+        """
+        bot_data["orders"/"pricing"/"invoice_numbers"] تصير قواميس المخزن.
+        الطلبات المحفوظة بـ bot_data من قبل المخزن (ومو موجودة بقاعدة البيانات) تنضاف وتنكتب.
+        """
+        if bot_data.get("orders") is self.orders:
+            return
+        self._refresh()
+        legacy_orders = bot_data.get("orders") or {}
+        # طلب تأرشف والبوت واكف: يبقى بـ bot_data المحفوظ — ما نرجعه لـ orders
+        try:
+            archived = archived_order_ids([oid for oid in list(legacy_orders) if oid not in self.orders]) if self.enabled else set()
+        except Exception as e:
+            # نحاول ويا الـ handler الجاي (attach يتنادى بكل handler)
+            logger.error(f"Error checking archived orders before attaching bot_data: {e}")
+            return
+        with self._lock:
+            legacy_pricing = bot_data.get("pricing") or {}
+            legacy_invoices = bot_data.get("invoice_numbers") or {}
+            imported = 0
+            for oid, order in list(legacy_orders.items()):
+                if oid in self.orders or oid in self._deleted_orders or oid in archived:
+                    continue
+                order = dict(order, id=oid)
+                order.setdefault("invoice_no", legacy_invoices.get(oid))
+                self.orders[oid] = order
+                self.pricing[oid] = {p: dict(v) for p, v in (legacy_pricing.get(oid) or {}).items()}
+                self.invoice_numbers[oid] = order["invoice_no"]
+                self._order_versions[oid] = self._local_version_locked()
+                self._restatus_locked(oid)
+                self._queue_locked(oid)
+                imported += 1
+            bot_data["orders"] = self.orders
+            bot_data["pricing"] = self.pricing
+            bot_data["invoice_numbers"] = self.invoice_numbers
+        if imported:
+            logger.info(f"Imported {imported} orders from bot_data into the order repository.")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "loaded": self._loaded,
+                "orders": len(self.orders),
+                "cursor": self.cursor,
+                "horizon": self.horizon,
+                "tombstones": len(self._deleted_orders) + sum(len(p) for p in list(self._deleted_pricing.values())),
+                "full_loads": self.full_loads,
+                "syncs": self.syncs,
+                "sync_errors": self.sync_errors,
+                "write_errors": self.write_errors,
+                "last_sync_ms": round(self.last_sync_ms, 3),
+                "seconds_since_sync": round(time.monotonic() - self._synced_at, 1) if self._synced_at else None,
+            }
+
+
+order_repository = OrderRepository()
+
+
+def get_repository_stats():
+    return order_repository.stats()
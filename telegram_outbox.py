@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+رسائل أزرار الطلبات للتليكرام: تعديل بمكانها + طابور لكل كروب بحد سرعة.
+
+قبل: كل show_buttons يحذف رسالة الأزرار القديمة ويرسل وحدة جديدة — تسعير طلب بيه N منتج = ~2N طلب للـ Bot API،
+ولما أكثر من مجهز يشتغلون سوه نوصل حد التليكرام للكروب (429).
+هسه:
+- إذا رسالة أزرار الطلب موجودة بنفس الكروب تتعدل بمكانها (edit_message_text)؛ إذا انحذفت أو ما تنعدل نرسل جديدة.
+- كل كروب له طابور و worker واحد، وبين رسالتين بنفس الكروب OUTBOX_CHAT_INTERVAL ثانية على الأقل
+  (وبكل الكروبات OUTBOX_GLOBAL_RATE رسالة بالثانية).
+- تحديثات ورا بعض لنفس الطلب وهي بعدها بالطابور تندمج: ينرسل آخر نص وأزرار بس، والكل ياخذ نفس النتيجة.
+- 429 (RetryAfter): ننتظر المدة اللي يكولها التليكرام (لكل الكروبات) ونعيد؛ أخطاء الشبكة: backoff مضاعف.
+- TimedOut بالإرسال ما نعيده: يمكن الرسالة وصلت وما وصلنا الرد، والإعادة تكررها بالكروب. التعديل نعيده عادي
+  (نفس النص على نفس الرسالة).
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# أقل فرق (ثواني) بين رسالتين بنفس الكروب
+OUTBOX_CHAT_INTERVAL = float(os.environ.get("OUTBOX_CHAT_INTERVAL", "1"))
+# أقصى رسائل بالثانية لكل البوت
+OUTBOX_GLOBAL_RATE = float(os.environ.get("OUTBOX_GLOBAL_RATE", "25"))
+OUTBOX_MAX_RETRIES = int(os.environ.get("OUTBOX_MAX_RETRIES", "5"))
+OUTBOX_MAX_BACKOFF = float(os.environ.get("OUTBOX_MAX_BACKOFF", "30"))
+
+
+class _PendingUpdate:
+    __slots__ = ("chat_id", "message_id", "text", "reply_markup", "parse_mode", "future")
+
+    def __init__(self, chat_id, message_id, text, reply_markup, parse_mode, future):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self.future = future
+
+
+def _retry_after_seconds(e):
+    # نسخ python-telegram-bot الجديدة ترجع timedelta
+    value = e.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class TelegramOutbox:
+    def __init__(self, chat_interval=OUTBOX_CHAT_INTERVAL, global_rate=OUTBOX_GLOBAL_RATE, max_retries=OUTBOX_MAX_RETRIES):
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.max_retries = max_retries
+        self._queues = {}    # chat_id -> deque من مفاتيح (chat_id, key)
+        self._pending = {}   # (chat_id, key) -> _PendingUpdate
+        self._workers = {}   # chat_id -> task
+        self._next_slot = {}  # chat_id -> أقرب وقت للرسالة الجاية بالكروب
+        self._global_next = 0.0
+        self.sent = 0
+        self.edited = 0
+        self.unchanged = 0
+        self.merged = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.send_timeouts = 0
+
+    async def show(self, bot, chat_id, key, text, reply_markup=None, parse_mode=None, message_id=None):
+        """
+        عرض رسالة key (مثلاً رقم الطلب) بالكروب: تعديل message_id إذا موجود، وإلا إرسال جديدة.
+        يرجع message_id للرسالة اللي صارت تعرض النص (نفسها أو الجديدة).
+        """
+        k = (chat_id, key)
+        update = self._pending.get(k)
+        if update is not None:
+            # بعده ما انرسل: نبدل المحتوى بالأحدث
+            update.text, update.reply_markup, update.parse_mode = text, reply_markup, parse_mode
+            if update.message_id is None:
+                update.message_id = message_id
+            self.merged += 1
+        else:
+            update = _PendingUpdate(chat_id, message_id, text, reply_markup, parse_mode,
+                                    asyncio.get_running_loop().create_future())
+            self._pending[k] = update
+            self._queues.setdefault(chat_id, deque()).append(k)
+            if chat_id not in self._workers:
+                self._workers[chat_id] = asyncio.create_task(self._drain(bot, chat_id))
+        # shield: إلغاء واحد من المنتظرين ما يلغي الإرسال على الباقين
+        return await asyncio.shield(update.future)
+
+    async def _wait_turn(self, chat_id):
+        """نحجز وقت الرسالة الجاية (بالكروب وبكل البوت) قبل النوم حتى الكروبات ما تاخذ نفس الوقت."""
+        now = time.monotonic()
+        at = max(now, self._next_slot.get(chat_id, now), self._global_next)
+        self._next_slot[chat_id] = at + self.chat_interval
+        self._global_next = at + self.global_interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    async def _drain(self, bot, chat_id):
+        q = self._queues[chat_id]
+        try:
+            while q:
+                await self._wait_turn(chat_id)
+                # نشيله من _pending هسه بس: اللي وصل أثناء الانتظار اندمج بيه
+                k = q.popleft()
+                update = self._pending.pop(k)
+                try:
+                    result = await self._deliver(bot, update)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"[{chat_id}] Failed to deliver message for {k[1]}: {e}")
+                    update.future.set_exception(e)
+                else:
+                    update.future.set_result(result)
+        finally:
+            self._workers.pop(chat_id, None)
+            if not q:
+                self._queues.pop(chat_id, None)
+                if self._next_slot.get(chat_id, 0) <= time.monotonic():
+                    self._next_slot.pop(chat_id, None)
+
+    async def _deliver(self, bot, update):
+        attempt = 0
+        while True:
+            try:
+                if update.message_id is not None:
+                    try:
+                        await bot.edit_message_text(
+                            chat_id=update.chat_id, message_id=update.message_id, text=update.text,
+                            reply_markup=update.reply_markup, parse_mode=update.parse_mode,
+                        )
+                        self.edited += 1
+                        return update.message_id
+                    except BadRequest as e:
+                        if "not modified" in str(e).lower():
+                            self.unchanged += 1
+                            return update.message_id
+                        # انحذفت أو صارت قديمة وما تنعدل: نرسل جديدة
+                        logger.info(f"[{update.chat_id}] Cannot edit message {update.message_id} ({e}); sending a new one.")
+                        update.message_id = None
+                msg = await bot.send_message(
+                    chat_id=update.chat_id, text=update.text,
+                    reply_markup=update.reply_markup, parse_mode=update.parse_mode,
+                )
+                self.sent += 1
+                return msg.message_id
+            except RetryAfter as e:
+                error = e
+                self.rate_limited += 1
+                delay = _retry_after_seconds(e)
+                # حد التليكرام ممكن يكون على كل البوت: نوقف كل الكروبات هالمدة
+                self._global_next = max(self._global_next, time.monotonic() + delay)
+            except BadRequest:
+                raise
+            except TimedOut as e:
+                if update.message_id is None:
+                    # كان إرسال: ما نعرف وصل لو لا، فما نعيده حتى ما تطلع الرسالة مرتين
+                    self.send_timeouts += 1
+                    logger.warning(f"[{update.chat_id}] Timed out sending a message; it may have been delivered, not retrying.")
+                    raise
+                error = e
+                delay = min(2.0 ** attempt, OUTBOX_MAX_BACKOFF)
+                logger.warning(f"[{update.chat_id}] Timed out editing message {update.message_id}. Retrying in {delay:.0f}s.")
+            except NetworkError as e:
+                error = e
+                delay = min(2.0 ** attempt, OUTBOX_MAX_BACKOFF)
+                logger.warning(f"[{update.chat_id}] Telegram network error: {e}. Retrying in {delay:.0f}s.")
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "chats_queued": len(self._queues),
+            "pending": len(self._pending),
+            "sent": self.sent,
+            "edited": self.edited,
+            "unchanged": self.unchanged,
+            "merged": self.merged,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+            "send_timeouts": self.send_timeouts,
+        }
+
+
+telegram_outbox = TelegramOutbox()
+
+
+def get_outbox_stats():
+    return telegram_outbox.stats()
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+نقطة دخول WSGI للوحة بوضع الإنتاج:
+    gunicorn -c gunicorn.conf.py wsgi:app
+البوت ما يشتغل هنا — يشتغل بعملية لوحده (python bot.py) ويتشاركون نفس الإعدادات (متغيرات البيئة) وطبقة db.py.
+"""
+from main import app
+
+application = app